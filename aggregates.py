@@ -0,0 +1,339 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+import chart_data
+import parallel
+
+# Danceability is reported with three decimals, so 1001 bins on [0, 1] hold it exactly
+DANCE_BINS = 1001
+
+
+def unique_rows(bits):
+    # Sorted distinct rows of a (rows x words) bit matrix, and the position of every row among them
+    if bits.shape[1] == 1:
+        unique, inverse = np.unique(bits[:, 0], return_inverse=True)
+        return unique[:, None], inverse.reshape(-1)
+    unique, inverse = np.unique(bits, axis=0, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+def genre_sets(genre_index):
+    # Code every song by its exact set of genres ("combo"), plus a combo x genre membership table.
+    # Row blocks find their own sets, which are then merged into the codes of the whole table
+    bits = genre_index.bits
+    parts = parallel.map_blocks(lambda rows: unique_rows(bits[rows]), parallel.blocks(len(bits)))
+    if len(parts) == 1:
+        combo_bits, combo = parts[0]
+        return combo, combo_bits
+    combo_bits, codes = unique_rows(np.vstack([unique for unique, _ in parts]))
+    offsets = np.cumsum([0] + [len(unique) for unique, _ in parts])
+    combo = np.concatenate([codes[offset:][inverse] for offset, (_, inverse) in zip(offsets, parts)])
+    return combo, combo_bits
+
+
+def combo_genre_table(combo_bits, n_genres):
+    # combo x genre membership
+    combo_genres = np.zeros((len(combo_bits), n_genres), dtype=bool)
+    for code in range(n_genres):
+        word, bit = divmod(code, 64)
+        combo_genres[:, code] = (combo_bits[:, word] >> np.uint64(bit)) & np.uint64(1) == 1
+    return combo_genres
+
+
+def popcount(words):
+    return int(np.unpackbits(np.ascontiguousarray(words).view(np.uint8)).sum())
+
+
+def dance_bins(danceability):
+    return np.clip(np.rint(danceability * (DANCE_BINS - 1)), 0, DANCE_BINS - 1).astype(np.int64)
+
+
+class SongCube:
+    # Pre-aggregated (year x genre set x explicit) cube of counts, popularity sums and
+    # danceability histograms, built once when the data loads
+
+    def __init__(self, store, genre_index):
+        self.genre_index = genre_index
+        self.genres = genre_index.genres
+        combo, self.combo_bits = genre_sets(genre_index)
+        self.combo_genres = combo_genre_table(self.combo_bits, len(self.genres))
+        # Genre set of every row, kept so a refresh can take rows back out of the cube
+        self.combo = combo
+
+        years = store['year'].astype(np.int64)
+        self.year_min = int(years.min()) if len(years) else 0
+        self.n_years = int(years.max()) - self.year_min + 1 if len(years) else 0
+        n_combos = len(self.combo_genres)
+        shape = (self.n_years, n_combos, 2)
+        size = int(np.prod(shape))
+        year0 = years - self.year_min
+        explicit, popularity = store['explicit'], store['popularity']
+
+        # Counts and popularity sums: one small partial cube per row block, added up
+        def cell_sums(rows):
+            cell = ((year0[rows] * n_combos + combo[rows]) * 2 + explicit[rows].astype(np.int64))
+            return np.bincount(cell, minlength=size), np.bincount(cell, weights=popularity[rows], minlength=size)
+
+        parts = parallel.map_blocks(cell_sums, parallel.blocks(len(years)))
+        self.counts = sum(counts for counts, _ in parts).reshape(shape)
+        self.popularity = sum(popularity for _, popularity in parts).reshape(shape)
+
+        # Danceability histograms and artist keys are split by year instead, into groups with
+        # similar song counts: each group fills its own years, so nothing needs merging and the
+        # artist keys, sorted year first, are simply concatenated
+        artist_codes, self.artists = store.artist_codes, store.artists
+        n_artists = max(len(self.artists), 1)
+        danceability = store['danceability']
+        groups = parallel.balanced(self.counts.sum(axis=(1, 2)), parallel.n_blocks(len(years)))
+
+        def year_group(group):
+            if len(groups) == 1:
+                rows = slice(None)
+            else:
+                rows = np.flatnonzero((year0 >= group.start) & (year0 < group.stop))
+            year_combo = year0[rows] * n_combos + combo[rows]
+            n_cells = (group.stop - group.start) * n_combos
+            hist = np.bincount(
+                (year_combo - group.start * n_combos) * DANCE_BINS + dance_bins(danceability[rows]),
+                minlength=n_cells * DANCE_BINS
+            ).reshape(group.stop - group.start, n_combos, DANCE_BINS).astype(np.int32)
+            # Artists are too many for a dense dimension, keep sparse (year, combo, artist) counts instead
+            # Store artist codes are already alphabetical
+            keys, counts = np.unique(year_combo * n_artists + artist_codes[rows].astype(np.int64), return_counts=True)
+            return hist, keys, counts
+
+        parts = parallel.map_blocks(year_group, groups)
+        self.danceability = (np.concatenate([hist for hist, _, _ in parts])
+                             if parts else np.zeros((0, n_combos, DANCE_BINS), dtype=np.int32))
+        keys = np.concatenate([keys for _, keys, _ in parts]) if parts else np.zeros(0, dtype=np.int64)
+        self.artist_count = np.concatenate([counts for _, _, counts in parts]) if parts else np.zeros(0, dtype=np.int64)
+        year_combo, self.artist_code = np.divmod(keys, n_artists)
+        self.artist_year, self.artist_combo = np.divmod(year_combo, n_combos)
+        self.index_years()
+
+    def index_years(self):
+        # Year-range summaries, so a rollup costs O(years) rather than O(songs).
+        # Prefix sums over the year axis: cum_counts[b] - cum_counts[a] sums years a..b-1
+        cell_shape = (1,) + self.counts.shape[1:]
+        self.cum_counts = np.concatenate([np.zeros(cell_shape, dtype=np.int64), self.counts.cumsum(axis=0)])
+        self.cum_popularity = np.concatenate([np.zeros(cell_shape), self.popularity.cumsum(axis=0)])
+        # Start of each year in the sparse artist keys, which are sorted year first
+        self.year_offsets = np.searchsorted(self.artist_year, np.arange(self.n_years + 1))
+        # Per year, the bitset of artists with a song in any genre; a year range ORs them together
+        self.has_genre = self.combo_genres.any(axis=1)
+        keys = self.has_genre[self.artist_combo]
+        codes = self.artist_code[keys]
+        self.year_artists = np.zeros((self.n_years, max(1, (len(self.artists) + 63) // 64)), dtype=np.uint64)
+        np.bitwise_or.at(self.year_artists, (self.artist_year[keys], codes // 64),
+                         np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)))
+
+    def updated(self, store, genre_index, removed, start, artist_remap):
+        # Cube of a store extended from this one (see SongStore.extended): only the cells of the
+        # removed rows and of the rows from start on are touched
+        cube = copy.copy(self)
+        cube.genre_index, cube.genres, cube.artists = genre_index, genre_index.genres, store.artists
+        added = np.arange(start, len(store))
+
+        # Genre sets of the new rows, adding the sets not seen before
+        combo_bits = np.zeros((len(self.combo_bits), genre_index.n_words), dtype=np.uint64)
+        combo_bits[:, :self.combo_bits.shape[1]] = self.combo_bits
+        known = {bits.tobytes(): code for code, bits in enumerate(combo_bits)}
+        unique_bits, inverse = np.unique(genre_index.bits[start:], axis=0, return_inverse=True)
+        codes = [known.setdefault(bits.tobytes(), len(known)) for bits in unique_bits]
+        added_combo = np.asarray(codes, dtype=np.int64)[inverse.reshape(-1)]
+        new_bits = unique_bits[np.asarray(codes, dtype=np.int64) >= len(combo_bits)]
+        cube.combo_bits = np.vstack([combo_bits, new_bits]) if len(new_bits) else combo_bits
+        cube.combo_genres = combo_genre_table(cube.combo_bits, len(cube.genres))
+        n_combos = len(cube.combo_bits)
+
+        # Widen the year axis when new rows fall outside it
+        years = store['year'][added].astype(np.int64)
+        year_max = self.year_min + self.n_years - 1
+        if len(years):
+            cube.year_min = min(self.year_min, int(years.min()))
+            cube.n_years = max(year_max, int(years.max())) - cube.year_min + 1
+        shift = self.year_min - cube.year_min
+
+        def grown(values):
+            out = np.zeros((cube.n_years, n_combos) + values.shape[2:], dtype=values.dtype)
+            out[shift:shift + self.n_years, :values.shape[1]] = values
+            return out
+
+        cube.counts, cube.popularity, cube.danceability = (
+            grown(self.counts), grown(self.popularity), grown(self.danceability))
+        for rows, combos, sign in ((removed, self.combo[removed], -1), (added, added_combo, 1)):
+            year = store['year'][rows].astype(np.int64) - cube.year_min
+            explicit = store['explicit'][rows].astype(np.int64)
+            np.add.at(cube.counts, (year, combos, explicit), sign)
+            np.add.at(cube.popularity, (year, combos, explicit), sign * store['popularity'][rows].astype(np.int64))
+            np.add.at(cube.danceability, (year, combos, dance_bins(store['danceability'][rows])), sign)
+
+        # Sparse artist counts: old keys stay sorted after the shift and the (monotonic) artist
+        # remap, so the delta is merged in with searchsorted instead of a full re-sort
+        n_artists = max(len(cube.artists), 1)
+        keys = ((self.artist_year + shift) * n_combos + self.artist_combo) * n_artists + artist_remap[self.artist_code]
+        rows = np.concatenate([removed, added])
+        delta_keys = ((store['year'][rows].astype(np.int64) - cube.year_min) * n_combos
+                      + np.concatenate([self.combo[removed], added_combo])) * n_artists + store.artist_codes[rows]
+        delta_keys, inverse = np.unique(delta_keys, return_inverse=True)
+        signs = np.r_[-np.ones(len(removed), dtype=np.int64), np.ones(len(added), dtype=np.int64)]
+        delta = np.bincount(inverse.reshape(-1), weights=signs, minlength=len(delta_keys)).astype(np.int64)
+
+        pos = np.searchsorted(keys, delta_keys)
+        found = np.zeros(len(pos), dtype=bool)
+        if len(keys):
+            found = keys[np.minimum(pos, len(keys) - 1)] == delta_keys
+        counts = self.artist_count.copy()
+        counts[pos[found]] += delta[found]
+        keys = np.insert(keys, pos[~found], delta_keys[~found])
+        counts = np.insert(counts, pos[~found], delta[~found])
+        keep = counts != 0
+        keys, cube.artist_count = keys[keep], counts[keep]
+        year_combo, cube.artist_code = np.divmod(keys, n_artists)
+        cube.artist_year, cube.artist_combo = np.divmod(year_combo, n_combos)
+
+        combo = np.concatenate([self.combo, added_combo])
+        combo[removed] = -1
+        cube.combo = combo
+        cube.index_years()
+        return cube
+
+    def year_slice(self, year_range):
+        start = max(int(year_range[0]) - self.year_min, 0)
+        stop = min(int(year_range[1]) - self.year_min + 1, self.n_years)
+        return slice(start, max(start, stop))
+
+    def combo_mask(self, selected_genres):
+        # Genre sets that contain at least one selected genre
+        selected_genres = set(selected_genres)
+        if self.genre_index.all_selected(selected_genres):
+            return self.combo_genres.any(axis=1)
+        codes = [self.genre_index.codes[g] for g in selected_genres if g in self.genre_index.codes]
+        return self.combo_genres[:, codes].any(axis=1)
+
+    def rollup(self, year_range, selected_genres):
+        return CubeView(self, self.year_slice(year_range), self.combo_mask(selected_genres))
+
+
+class CubeView:
+    # One year range / genre selection rolled up from the cube
+
+    def __init__(self, cube, years, combos):
+        self.cube = cube
+        self.years = years
+        self.combos = combos
+
+        counts = cube.cum_counts[years.stop][combos] - cube.cum_counts[years.start][combos]
+        self.total_songs = int(counts.sum())
+        self.non_explicit_count, self.explicit_count = (int(c) for c in counts.sum(axis=0))
+
+        combo_genres = cube.combo_genres[combos].astype(np.int64)
+        self.genre_song_count = counts.sum(axis=1) @ combo_genres
+        popularity = cube.cum_popularity[years.stop][combos] - cube.cum_popularity[years.start][combos]
+        self.genre_popularity = popularity.sum(axis=1) @ combo_genres
+        self.total_genres = int((self.genre_song_count > 0).sum())
+
+        self.year_counts = cube.counts[years][:, combos].sum(axis=(1, 2))
+        self.year_popularity = cube.popularity[years][:, combos].sum(axis=(1, 2))
+
+        if np.array_equal(combos, cube.has_genre):
+            # All genres: union of the per-year artist sets
+            self.total_artists = popcount(np.bitwise_or.reduce(cube.year_artists[years], axis=0))
+        else:
+            self.total_artists = int((self.artist_song_count() > 0).sum())
+
+    def artist_song_count(self):
+        # Songs per artist, from the sparse keys of the selected years only, in blocks of keys
+        cube = self.cube
+        start, stop = cube.year_offsets[self.years.start], cube.year_offsets[self.years.stop]
+
+        def partial(block):
+            keys = slice(start + block.start, start + block.stop)
+            selected = self.combos[cube.artist_combo[keys]]
+            return np.bincount(
+                cube.artist_code[keys][selected], weights=cube.artist_count[keys][selected], minlength=len(cube.artists)
+            )
+
+        return sum(parallel.map_blocks(partial, parallel.blocks(stop - start))).astype(np.int64)
+
+    def _genre_frame(self, values, column):
+        # Alphabetical genre order, like groupby('genre') on the exploded rows
+        frame = pd.DataFrame({'genre': self.cube.genres, column: values})
+        frame = frame[self.genre_song_count > 0]
+        return frame.sort_values('genre').reset_index(drop=True)
+
+    def genre_counts(self):
+        return self._genre_frame(self.genre_song_count, 'song_count')
+
+    def genre_popularity_sums(self):
+        return self._genre_frame(np.rint(self.genre_popularity).astype(np.int64), 'total_popularity')
+
+    def artist_counts(self):
+        artist_song_count = self.artist_song_count()
+        present = artist_song_count > 0
+        return pd.DataFrame({
+            'artist': np.asarray(self.cube.artists)[present],
+            'song_count': artist_song_count[present],
+        })
+
+    def annual_trends(self):
+        present = self.year_counts > 0
+        years = np.arange(self.cube.n_years)[self.years] + self.cube.year_min
+        return pd.DataFrame({
+            'year': years[present],
+            'total_songs': self.year_counts[present],
+            'avg_popularity': self.year_popularity[present] / self.year_counts[present],
+        })
+
+    def danceability_histograms(self):
+        # Genre x bin counts of danceability over the selected songs, in blocks of genre sets.
+        # The products run in float64 (BLAS), exact for counts below 2**53
+        cube = self.cube
+        n_years = self.years.stop - self.years.start
+
+        def partial(block):
+            selected = self.combos[block]
+            hist = cube.danceability[self.years, block].sum(axis=0, dtype=np.int64)[selected]
+            return cube.combo_genres[block][selected].T.astype(np.float64) @ hist.astype(np.float64)
+
+        min_combos = parallel.MIN_BLOCK_ROWS // max(n_years * DANCE_BINS, 1)
+        hist = sum(parallel.map_blocks(partial, parallel.blocks(len(self.combos), max(min_combos, 1))))
+        return np.rint(hist).astype(np.int64)
+
+    def danceability_summaries(self):
+        # Five-number summary of danceability per genre, straight from the histograms
+        values = np.arange(DANCE_BINS) / (DANCE_BINS - 1)
+        return chart_data.box_summaries(self.danceability_histograms(), self.cube.genres, values)
+
+
+class SampleRollup:
+    # Estimate of a CubeView from a uniform sample of the selected rows, drawn while the exact
+    # rollup of a heavy chart is still being computed (see progressive.py). Counts are scaled up
+    # to the whole selection; distributions are those of the sample
+
+    def __init__(self, store, rows, total_songs):
+        self.store = store
+        self.rows = rows
+        self.scale = total_songs / max(len(rows), 1)
+
+    def artist_counts(self):
+        codes, counts = np.unique(self.store.artist_codes[self.rows], return_counts=True)
+        return pd.DataFrame({
+            'artist': np.asarray(self.store.artists)[codes],
+            'song_count': np.rint(counts * self.scale).astype(np.int64),
+        })
+
+    def danceability_summaries(self):
+        # Same summaries as CubeView, from the histograms of the sampled rows
+        store = self.store
+        starts = store.genre_offsets[self.rows]
+        lengths = store.genre_offsets[self.rows + 1] - starts
+        ends = np.cumsum(lengths)
+        positions = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+        bins = np.repeat(dance_bins(store['danceability'][self.rows]), lengths)
+        hist = np.bincount(store.genre_codes[positions].astype(np.int64) * DANCE_BINS + bins,
+                           minlength=len(store.genres) * DANCE_BINS).reshape(len(store.genres), DANCE_BINS)
+        values = np.arange(DANCE_BINS) / (DANCE_BINS - 1)
+        return chart_data.box_summaries(hist, store.genres, values)
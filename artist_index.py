@@ -0,0 +1,115 @@
+import copy
+
+import numpy as np
+
+import chart_data
+from search_index import TrigramIndex, normalize, padded
+
+
+class ArtistIndex:
+    # Songs grouped by artist (artist -> range of row positions) plus a prefix/trigram name index
+
+    def __init__(self, store):
+        self.group(store)
+
+        normalized = [normalize(artist) for artist in self.artists]
+        self.name_order = np.argsort(np.asarray(normalized, dtype=object), kind='stable')
+        self.sorted_names = np.asarray(normalized, dtype=object)[self.name_order]
+        # Codes follow alphabetical order, so ranking by -code lists matches alphabetically
+        self.names = TrigramIndex([padded([name]) for name in normalized], -np.arange(len(self.artists)))
+
+    def group(self, store):
+        codes = store.artist_codes
+        self.artists = store.artists
+        self.codes = {artist: code for code, artist in enumerate(self.artists)}
+
+        # Row positions grouped by artist, keeping the table order inside each group
+        self.rows = np.argsort(codes, kind='stable')
+        self.offsets = np.searchsorted(codes[self.rows], np.arange(len(self.artists) + 1))
+
+    def updated(self, store, artist_remap):
+        # Index of a store extended from this one; only the names of new artists are normalized
+        # and tokenized, existing entries just follow their moved codes
+        index = copy.copy(self)
+        index.group(store)
+        new_codes = np.setdiff1d(np.arange(len(index.artists)), artist_remap)
+        new_names = np.asarray([normalize(artist) for artist in index.artists[new_codes]], dtype=object)
+
+        order = np.argsort(new_names, kind='stable')
+        at = np.searchsorted(self.sorted_names, new_names[order], side='right')
+        index.sorted_names = np.insert(self.sorted_names, at, new_names[order])
+        index.name_order = np.insert(artist_remap[self.name_order], at, new_codes[order])
+
+        texts = np.empty(len(index.artists), dtype=object)
+        texts[artist_remap] = self.names.texts
+        texts[new_codes] = [padded([name]) for name in new_names]
+        index.names = self.names.updated(texts.tolist(), -np.arange(len(index.artists)), new_codes, artist_remap)
+        return index
+
+    def rows_of(self, code):
+        return self.rows[self.offsets[code]:self.offsets[code + 1]]
+
+    def artist_rows(self, artist, mask=None):
+        # Row positions of one artist's songs, optionally restricted to the filtered rows
+        code = self.codes.get(artist)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        rows = self.rows_of(code)
+        return rows if mask is None else rows[mask[rows]]
+
+    def prefix_matches(self, term):
+        lo = np.searchsorted(self.sorted_names, term, side='left')
+        hi = np.searchsorted(self.sorted_names, term + '\U0010ffff', side='left')
+        return np.sort(self.name_order[lo:hi])
+
+    def present(self, codes, mask):
+        # Keep the artists that still have at least one song in the filtered rows
+        if not len(codes):
+            return codes
+        lengths = self.offsets[codes + 1] - self.offsets[codes]
+        starts = np.r_[0, np.cumsum(lengths)[:-1]]
+        positions = np.repeat(self.offsets[codes] - starts, lengths) + np.arange(lengths.sum())
+        return codes[np.add.reduceat(mask[self.rows[positions]], starts) > 0]
+
+    def lookup(self, term, mask=None):
+        # Artists whose name contains the term: prefix matches first, then the rest, each alphabetical
+        term = normalize(term)
+        if not term:
+            return []
+        prefix = self.prefix_matches(term)
+        others = np.setdiff1d(self.names.search(term), prefix, assume_unique=True)
+        codes = np.concatenate([prefix, others]).astype(np.int64)
+        if mask is not None:
+            codes = self.present(codes, mask)
+        return self.artists[codes].tolist()
+
+
+class ArtistProfile:
+    # Everything the Search Artists page charts for one artist under one filter state
+
+    def __init__(self, artist, songs, song_count=None):
+        # With song_count, songs is a sample of that many songs and the counts below are scaled up
+        self.artist = artist
+        self.song_count = len(songs) if song_count is None else song_count
+        scale = self.song_count / max(len(songs), 1)
+
+        self.avg_popularity = chart_data.yearly_mean(songs, 'popularity', 'avg_popularity')
+        self.avg_duration = chart_data.yearly_mean(songs, 'duration', 'avg_duration')
+
+        # Group data by year and count the number of songs
+        songs_per_year = songs.groupby('year')['song'].count().reset_index()
+        songs_per_year.columns = ['year', 'num_songs']
+        songs_per_year['num_songs'] = (songs_per_year['num_songs'] * scale).round().astype(int)
+        # String version for the tooltip, to guarantee no decimals
+        songs_per_year['num_songs_str'] = songs_per_year['num_songs'].astype(str)
+        self.songs_per_year = songs_per_year
+
+        self.top_songs = songs.sort_values(by='popularity', ascending=False).head(5)[['song', 'popularity']]
+
+        # Explode genres for each song to handle multiple genres per song
+        genre_count = songs.explode('genre').groupby('genre')['song'].count().reset_index()
+        genre_count.columns = ['genre', 'num_songs']
+        genre_count['num_songs'] = (genre_count['num_songs'] * scale).round().astype(int)
+        self.genre_count = genre_count
+
+        self.loudness, self.loudness_truncated = chart_data.thin_points(songs[['song', 'artist', 'loudness']], 'loudness')
@@ -0,0 +1,96 @@
+# App check: scripted interactions with tubes_uas_streamlit.py through streamlit.testing.AppTest,
+# asserting what the page shows after each step
+#
+#   python benchmarks/app_check.py
+#
+# Runs on the CSV the app reads (SPOTIFY_DATASET, songs_normalize.csv by default).
+# Exits with status 1 when any check fails.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+SCRIPT = os.path.join(ROOT, 'tubes_uas_streamlit.py')
+
+
+def start():
+    at = AppTest.from_file(SCRIPT, default_timeout=300)
+    at.run()
+    return at
+
+
+def click(at, label):
+    [button for button in at.button if button.label == label][0].click().run()
+
+
+def navigation(at):
+    # (page shown, Previous disabled, Next disabled)
+    info = [m.value for m in at.markdown if m.value.startswith('Page **')][0]
+    disabled = {button.label: button.disabled for button in at.button if button.label in ('Previous', 'Next')}
+    return int(info.split('**')[1]), disabled['Previous'], disabled['Next']
+
+
+def walk_pages(at):
+    # Next up to the last page and Previous back to the first; the buttons must be enabled
+    # exactly when there is a page to go to, on the rerun that shows the page
+    n_pages = int([m.value for m in at.markdown if m.value.startswith('Page **')][0].split('**')[3])
+    if n_pages < 3:
+        return f"only {n_pages} pages to walk"
+    steps = [('Next', page) for page in range(2, n_pages + 1)] + [('Previous', page) for page in range(n_pages - 1, 0, -1)]
+    for label, page in steps:
+        click(at, label)
+        expected = (page, page <= 1, page >= n_pages)
+        if navigation(at) != expected:
+            return f"after {label}: (page, Previous disabled, Next disabled) is {navigation(at)}, expected {expected}"
+
+
+def search_pagination():
+    at = start()
+    click(at, "Search Songs")
+    at.text_input[0].input("girl").run()
+    return walk_pages(at)
+
+
+def about_pagination():
+    # The whole catalogue at 500 rows per page
+    at = start()
+    click(at, "About")
+    [box for box in at.selectbox if box.label == "Rows per page"][0].select(500).run()
+    return walk_pages(at)
+
+
+def no_genres_selected():
+    # Select All unchecked with nothing picked in the genre list: no songs, and no error
+    at = start()
+    at.checkbox[0].uncheck().run()
+    if at.exception:
+        return at.exception[0].message
+    if "No songs match the filters" not in [info.value for info in at.info]:
+        return "no notice that nothing matches"
+
+
+CASES = {
+    'search_pagination': search_pagination,
+    'about_pagination': about_pagination,
+    'no_genres_selected': no_genres_selected,
+}
+
+
+def main():
+    failures = 0
+    for name, case in CASES.items():
+        try:
+            problem = case()
+        except Exception as error:
+            problem = f"{type(error).__name__}: {error}"
+        failures += problem is not None
+        print(f"{name:<32} {'ok' if problem is None else 'FAILED: ' + problem}")
+    print(f"{failures} failed checks", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
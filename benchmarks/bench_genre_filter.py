@@ -0,0 +1,72 @@
+# Benchmark for the sidebar year + genre filter at catalogue sizes far above songs_normalize.csv
+#
+#   python benchmarks/bench_genre_filter.py --rows 1000000
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from genre_index import GenreIndex  # noqa: E402
+
+GENRES = ['pop', 'hip hop', 'R&B', 'Dance/Electronic', 'rock', 'metal', 'latin', 'country',
+          'Folk/Acoustic', 'easy listening', 'blues', 'jazz', 'World/Traditional', 'classical']
+
+
+def synthetic_genres(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    # Skewed towards the first genres, 1 to 3 genres per song like the real dataset
+    weights = 1 / np.arange(1, len(GENRES) + 1)
+    picks = rng.choice(len(GENRES), size=(rows, 3), p=weights / weights.sum())
+    counts = rng.integers(1, 4, size=rows)
+    return pd.Series([list(dict.fromkeys(GENRES[g] for g in row[:n])) for row, n in zip(picks, counts)])
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, float(np.median(timings)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--baseline-rows', type=int, default=100_000,
+                        help='rows to time the old per-row lambda on (0 to skip)')
+    args = parser.parse_args()
+
+    genres = synthetic_genres(args.rows)
+    years = np.random.default_rng(1).integers(1998, 2021, size=args.rows)
+
+    start = time.perf_counter()
+    index = GenreIndex(genres)
+    print(f"build index: {(time.perf_counter() - start) * 1000:.1f} ms for {args.rows} rows")
+
+    cases = {
+        'all genres': index.genres,
+        'one genre': ['rock'],
+        'three genres': ['rock', 'latin', 'jazz'],
+        'no genre': [],
+    }
+    for name, selected in cases.items():
+        best, median = best_of(lambda: index.filter_mask(years, (2005, 2015), selected), args.repeat)
+        print(f"filter_mask {name:>13}: best {best:7.2f} ms  median {median:7.2f} ms")
+
+    if args.baseline_rows:
+        sub = pd.DataFrame({'year': years[:args.baseline_rows], 'genre': genres[:args.baseline_rows]})
+        genre_filter = sub['genre'].explode().unique()
+        best, _ = best_of(lambda: sub[(sub['year'] >= 2005) & (sub['year'] <= 2015) &
+                                      sub['genre'].apply(lambda x: any(g in genre_filter for g in x))], 1)
+        print(f"old lambda filter, all genres, {args.baseline_rows} rows: {best:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
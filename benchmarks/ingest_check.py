@@ -0,0 +1,134 @@
+# Ingest check: the chunked, incremental CSV ingest (data_loader.IngestState) against a plain
+# read_csv + preprocess of the same file, on edge cases of the real songs_normalize.csv
+#
+#   python benchmarks/ingest_check.py
+#
+# Every case works on a copy of the CSV in a temporary directory, with its own snapshot directory.
+# Exits with status 1 when any check fails.
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import data_loader  # noqa: E402
+from live_dataset import LiveDataset  # noqa: E402
+
+SOURCE = os.path.join(ROOT, 'songs_normalize.csv')
+
+# A later, more popular release of a song whose title reads as a number
+NUMERIC_TITLE = 'Taylor Swift,22,232120,False,2013,90,0.661,0.729,7,-6.561,1,0.0376,0.00215,0.0013,0.0477,0.668,103.987,pop'
+
+
+def same_songs(expected, actual):
+    # Same labels, values and text columns; None when they are
+    try:
+        pd.testing.assert_frame_equal(expected.sort_index(), actual.sort_index(), check_dtype=False, check_exact=True)
+    except AssertionError as error:
+        return str(error).splitlines()[0]
+    mixed = [column for column in data_loader.TEXT_COLUMNS[:2] if not actual[column].map(type).eq(str).all()]
+    if mixed:
+        return f"non-text values in {', '.join(mixed)}"
+
+
+def expected_songs(path):
+    return data_loader.preprocess(pd.read_csv(path))
+
+
+def live_songs(live):
+    store = live.current.store
+    return store.frame(np.flatnonzero(store.live))
+
+
+def append(path, line):
+    with open(path, 'a') as f:
+        f.write(line)
+
+
+def numeric_title_append(path):
+    # A row titled "22" appended after a snapshot is parsed on its own, then reloaded from the snapshot
+    data_loader.load_songs(path)
+    append(path, NUMERIC_TITLE + '\n')
+    problem = same_songs(expected_songs(path), data_loader.load_songs(path))
+    return problem or same_songs(expected_songs(path), data_loader.load_songs(path))
+
+
+def no_trailing_newline(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data.rstrip(b'\n'))
+    state = data_loader.open_state(path)
+    if state.rows != len(pd.read_csv(path)):
+        return f"{state.rows} rows read instead of {len(pd.read_csv(path))}"
+    return same_songs(expected_songs(path), state.songs())
+
+
+def numeric_title_refresh(path):
+    # The watcher applies the same row as a delta: it replaces the older "22" instead of adding a copy
+    live = LiveDataset(path, interval=3600)
+    append(path, NUMERIC_TITLE + '\n')
+    live.refresh()
+    problem = same_songs(expected_songs(path), live_songs(live))
+    if problem is None and data_loader.IngestState.load(data_loader.snapshot_path(path)) is None:
+        problem = "no snapshot saved after the refresh"
+    return problem
+
+
+def held_partial_line(path):
+    # The watcher leaves an unterminated appended line for later, and reads it once the file
+    # has stopped growing
+    live = LiveDataset(path, interval=3600)
+    append(path, NUMERIC_TITLE.replace(',22,', ',Held Back,'))
+    live.refresh()
+    if len(live_songs(live)) != len(expected_songs(SOURCE)):
+        return "read a line that may still be being written"
+    live.refresh()
+    return same_songs(expected_songs(path), live_songs(live))
+
+
+def repeated_songs_small_chunks(path):
+    # Every song read again in later chunks with other popularities, ties included, so most best
+    # rows get replaced and the parts of the state are rewritten as one frame along the way
+    raw = pd.read_csv(path)
+    rng = np.random.default_rng(0)
+    copies = [raw.assign(popularity=rng.integers(0, 5, len(raw))) for _ in range(6)]
+    pd.concat(copies, ignore_index=True).sample(frac=1, random_state=0).to_csv(path, index=False)
+    state = data_loader.IngestState()
+    state.read(path, chunk_size=700)
+    return same_songs(expected_songs(path), state.songs())
+
+
+CASES = {
+    'numeric_title_append': numeric_title_append,
+    'no_trailing_newline': no_trailing_newline,
+    'numeric_title_refresh': numeric_title_refresh,
+    'held_partial_line': held_partial_line,
+    'repeated_songs_small_chunks': repeated_songs_small_chunks,
+}
+
+
+def main():
+    failures = 0
+    for name, case in CASES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            data_loader.SNAPSHOT_DIR = os.path.join(tmp, 'snapshots')
+            path = os.path.join(tmp, 'songs.csv')
+            shutil.copyfile(SOURCE, path)
+            try:
+                problem = case(path)
+            except Exception as error:
+                problem = f"{type(error).__name__}: {error}"
+        failures += problem is not None
+        print(f"{name:<32} {'ok' if problem is None else 'FAILED: ' + problem}")
+    print(f"{failures} failed checks", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+# Headless benchmark of the dashboard: per-phase timings and peak memory on synthetic catalogues
+#
+#   python benchmarks/run_benchmarks.py --sizes 2000 100000 1000000 --output bench.json
+#
+# Library phases call the loading / index / query code directly. API phases load-test
+# query_api.py over HTTP. App phases drive tubes_uas_streamlit.py through
+# streamlit.testing.AppTest with scripted widget interactions.
+# Results are written as JSON so runs can be compared between versions.
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import data_loader  # noqa: E402
+import exports  # noqa: E402
+import parallel  # noqa: E402
+import progressive  # noqa: E402
+import shared_store  # noqa: E402
+import synthetic_data  # noqa: E402
+from aggregates import SampleRollup, SongCube  # noqa: E402
+from artist_index import ArtistIndex, ArtistProfile  # noqa: E402
+from genre_index import GenreIndex  # noqa: E402
+from live_dataset import Dataset, LiveDataset  # noqa: E402
+from query_api import QueryServer  # noqa: E402
+from query_engine import sample_rows  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+from similar_songs import SimilarSongs  # noqa: E402
+from song_store import SongStore  # noqa: E402
+from warmup import warm  # noqa: E402
+
+APP = os.path.join(ROOT, 'tubes_uas_streamlit.py')
+
+
+class Recorder:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def measure(self, rows, phase, fn):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+        record = {'rows': rows, 'phase': phase, 'seconds': round(seconds, 6)}
+        if self.trace_memory:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+        if isinstance(value, AppError):
+            record['error'] = value.message
+        self.results.append(record)
+        print(f"{rows:>10} {phase:<32} {seconds * 1000:10.1f} ms{'  ERROR' if 'error' in record else ''}", file=sys.stderr)
+        return value
+
+
+class AppError:
+    # Uncaught exception raised by the script during one scripted interaction
+    def __init__(self, message):
+        self.message = message
+
+
+def home_aggregates(view):
+    # Everything the home page aggregates for one filter state
+    return (view.genre_counts(), view.genre_popularity_sums(), view.artist_counts(),
+            view.annual_trends(), view.danceability_summaries())
+
+
+# Aggregation threads compared against serial runs, on catalogues big enough to split into
+# blocks of parallel.MIN_BLOCK_ROWS
+SCALING_WORKERS = (1, 2, 4)
+
+
+def with_workers(count, fn):
+    # fn with count aggregation threads
+    def run():
+        workers = parallel.AGGREGATE_WORKERS
+        parallel.set_workers(count)
+        try:
+            return fn()
+        finally:
+            parallel.set_workers(workers)
+    return run
+
+
+def library_phases(rec, rows, path, seed=0):
+    raw = rec.measure(rows, 'read_csv', lambda: pd.read_csv(path))
+    df = rec.measure(rows, 'preprocess', lambda: data_loader.preprocess(raw))
+    del raw
+    rec.measure(rows, 'ingest_chunked', lambda: data_loader.IngestState().read(path))
+    store = rec.measure(rows, 'build_song_store', lambda: SongStore(df))
+    del df
+
+    # Cold start of a worker that maps an already published store
+    shared = os.path.join(data_loader.SNAPSHOT_DIR, f'shared_{rows}')
+    version = f'bench-{rows}'
+    rec.measure(rows, 'publish_shared_store', lambda: shared_store.publish(store, shared, version))
+    rec.measure(rows, 'attach_shared_store', lambda: shared_store.attach(shared, version))
+
+    genre_index = rec.measure(rows, 'build_genre_index', lambda: GenreIndex.from_store(store))
+    cube = rec.measure(rows, 'build_cube', lambda: SongCube(store, genre_index))
+    search_index = rec.measure(rows, 'build_search_index', lambda: SearchIndex.from_store(store))
+    artist_index = rec.measure(rows, 'build_artist_index', lambda: ArtistIndex(store))
+    similar_songs = rec.measure(rows, 'build_similar_songs', lambda: SimilarSongs(store))
+
+    years = store['year']
+    all_genres = genre_index.genres
+    some_genres = list(all_genres[:2])
+    rec.measure(rows, 'filter_all_genres', lambda: genre_index.filter_mask(years, (1998, 2020), all_genres))
+    rec.measure(rows, 'filter_year_range', lambda: genre_index.filter_mask(years, (2005, 2010), all_genres))
+    mask = rec.measure(rows, 'filter_genre_subset', lambda: genre_index.filter_mask(years, (1998, 2020), some_genres))
+    rec.measure(rows, 'rollup_all_genres', lambda: cube.rollup((1998, 2020), all_genres).danceability_summaries())
+    rec.measure(rows, 'rollup_year_range', lambda: cube.rollup((2005, 2010), all_genres))
+    rec.measure(rows, 'rollup_genre_subset', lambda: cube.rollup((2005, 2010), some_genres).danceability_summaries())
+    # The home page's aggregates for a new filter state
+    rec.measure(rows, 'home_aggregates', lambda: home_aggregates(cube.rollup((1998, 2020), some_genres)))
+    # Speedup of the aggregation threads over a serial run; smaller catalogues are never split
+    if rows >= 2 * parallel.MIN_BLOCK_ROWS:
+        for workers in SCALING_WORKERS:
+            rec.measure(rows, f'build_cube_workers_{workers}', with_workers(workers, lambda: SongCube(store, genre_index)))
+            rec.measure(rows, f'home_aggregates_workers_{workers}', with_workers(
+                workers, lambda: home_aggregates(cube.rollup((1998, 2020), some_genres))))
+    # First render of the heavy home charts when they miss the render budget
+    sampled = sample_rows(np.flatnonzero(mask), progressive.SAMPLE_ROWS)
+    sample_view = SampleRollup(store, sampled, int(mask.sum()))
+    rec.measure(rows, 'home_charts_sample', lambda: (sample_view.artist_counts(), sample_view.danceability_summaries()))
+
+    rec.measure(rows, 'search_broad', lambda: search_index.search('pop', mask=mask))
+    rec.measure(rows, 'similar_songs', lambda: similar_songs.nearest(len(store) // 2))
+    rec.measure(rows, 'similar_songs_filtered', lambda: similar_songs.nearest(len(store) // 2, mask=mask))
+    rec.measure(rows, 'search_narrow', lambda: search_index.search('love 12', mask=mask))
+    artist = rec.measure(rows, 'artist_lookup', lambda: artist_index.lookup('artist 1', mask=mask))
+    if artist:
+        artist_rows = artist_index.artist_rows(artist[0], mask)
+        rec.measure(rows, 'artist_profile', lambda: ArtistProfile(artist[0], store.frame(artist_rows)))
+        rec.measure(rows, 'artist_profile_sample', lambda: ArtistProfile(
+            artist[0], store.frame(sample_rows(artist_rows, progressive.ARTIST_SAMPLE_ROWS)), song_count=len(artist_rows)))
+
+    # Downloads of the whole table, written chunk by chunk
+    everything = store.view(genre_index.has_genre)
+    for extension in ('csv', 'parquet', 'jsonl'):
+        rec.measure(rows, f'export_{extension}', lambda: exports.export_file(everything, extension).close())
+
+    # Startup warm-up of a fresh version: indexes in parallel, then the default home charts
+    rec.measure(rows, 'warmup', lambda: warm(Dataset(version, store)))
+    del store, genre_index, cube, search_index, artist_index, similar_songs
+
+    # Incremental refresh of a live dataset with every index built, after 1% more rows of the same
+    # catalogue are appended
+    live_path = f'{os.path.splitext(path)[0]}_live.csv'
+    shutil.copyfile(path, live_path)
+    live = LiveDataset(live_path, interval=3600)
+    for name in ('genre_index', 'cube', 'artist_index', 'search_index'):
+        live.current.member(name)
+    appended = synthetic_data.generate(max(rows // 100, 1), seed=seed, start=rows, catalogue_rows=rows)
+    appended.to_csv(live_path, mode='a', header=False, index=False)
+    rec.measure(rows, 'refresh_append', live.refresh)
+    os.remove(live_path)
+
+
+def api_phases(rec, rows, path, clients=8, requests=50):
+    # Load test of the HTTP API: keep-alive clients in parallel, each sending a mix of
+    # home / search / artist / song page queries with different filters
+    server = QueryServer(path)
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(asyncio.start_server(server.handle, '127.0.0.1', 0))
+    port = listener.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    rec.measure(rows, 'api_ready', server.warmup.ready.wait)
+
+    targets = []
+    for i in range(clients * requests):
+        year_from = 1998 + i % 20
+        targets.append([
+            f'/home?year_from={year_from}',
+            f'/search?q=song+{i % 100}&year_from={year_from}',
+            f'/artists?q=artist+{i % 100}',
+            f'/songs?offset={i * 10}&limit=50&year_to={2020 - i % 20}',
+        ][i % 4])
+
+    def client(i):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        for target in targets[i * requests:(i + 1) * requests]:
+            connection.request('GET', target)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                return AppError(f'{target}: HTTP {response.status}')
+        connection.close()
+
+    def load():
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            errors = [error for error in pool.map(client, range(clients)) if error]
+        return errors[0] if errors else None
+
+    rec.measure(rows, 'api_load', load)
+    # The same requests again, answered from the response cache
+    rec.measure(rows, 'api_load_cached', load)
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    loop.close()
+    server.pool.shutdown()
+
+
+def click(at, label):
+    next(b for b in at.button if b.label == label).click()
+
+
+def app_phases(rec, rows, path, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    data_loader.DATASET_PATH = path
+    at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def step(phase, action=None):
+        def run():
+            if action:
+                action()
+            at.run()
+            if at.exception:
+                return AppError(at.exception[0].message)
+        rec.measure(rows, phase, run)
+
+    step('app_first_run')
+    step('app_rerun_unchanged')
+    step('app_year_slider', lambda: at.slider[0].set_value((2005, 2010)))
+    step('app_genre_toggle_off', lambda: at.checkbox[0].uncheck())
+    step('app_genre_select', lambda: at.multiselect[0].select(at.multiselect[0].options[0]))
+    step('app_genre_toggle_on', lambda: at.checkbox[0].check())
+    step('app_open_search_songs', lambda: click(at, 'Search Songs'))
+    step('app_search_term', lambda: at.text_input[0].input('pop'))
+    step('app_search_next_page', lambda: click(at, 'Next'))
+    step('app_open_search_artists', lambda: click(at, 'Search Artists'))
+    step('app_artist_term', lambda: at.text_input[0].input('artist 1'))
+    step('app_artist_pick', lambda: at.selectbox[0].select_index(min(1, len(at.selectbox[0].options) - 1)))
+    step('app_open_about', lambda: click(at, 'About'))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2_000, 100_000, 1_000_000])
+    parser.add_argument('--csv', help='benchmark this CSV instead of synthetic data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--skip-app', action='store_true', help='skip the AppTest phases')
+    parser.add_argument('--skip-api', action='store_true', help='skip the HTTP API load test')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='skip peak memory tracking (faster)')
+    parser.add_argument('--workers', type=int, default=parallel.AGGREGATE_WORKERS,
+                        help='aggregation threads (SPOTIFY_AGGREGATE_WORKERS)')
+    parser.add_argument('--timeout', type=float, default=600, help='AppTest timeout per rerun, in seconds')
+    args = parser.parse_args()
+
+    parallel.set_workers(args.workers)
+    rec = Recorder(trace_memory=not args.no_tracemalloc)
+    if rec.trace_memory:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep snapshots of the synthetic files out of the app's own snapshot directory
+        data_loader.SNAPSHOT_DIR = os.path.join(tmp, 'snapshots')
+
+        if args.csv:
+            datasets = [(sum(1 for _ in open(args.csv)) - 1, os.path.abspath(args.csv))]
+        else:
+            datasets = []
+            for rows in args.sizes:
+                path = os.path.join(tmp, f'songs_{rows}.csv')
+                rec.measure(rows, 'generate_csv', lambda: synthetic_data.write_csv(path, rows, seed=args.seed))
+                datasets.append((rows, path))
+
+        for rows, path in datasets:
+            library_phases(rec, rows, path, args.seed)
+            if not args.skip_api:
+                api_phases(rec, rows, path)
+            if not args.skip_app:
+                app_phases(rec, rows, path, args.timeout)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'tracemalloc': rec.trace_memory,
+            'aggregate_workers': parallel.AGGREGATE_WORKERS,
+        },
+        'results': rec.results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+# Scale check: the dashboard's stores and indexes against the original pandas logic
+#
+#   python benchmarks/scale_check.py --sizes 10000 1000000 10000000 --output scale.json
+#
+# For every size a synthetic catalogue (synthetic_data.py) is written to a temporary CSV and loaded
+# the way the app loads it. Preprocessing, the sidebar filters, song search, artist lookup and the
+# home page aggregates are then computed twice: by the reference_* functions below, which are the
+# pandas code the dashboard started from, and by the query engine the app uses now. The results
+# must be identical. Every step is timed with its peak traced memory, like run_benchmarks.py.
+# Exits with status 1 when any check fails.
+#
+# The reference side is as slow as the original: its per-row genre filter alone takes about a
+# minute per million rows, so sizes of tens of millions run for hours.
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import data_loader  # noqa: E402
+import parallel  # noqa: E402
+import synthetic_data  # noqa: E402
+from live_dataset import LiveDataset  # noqa: E402
+
+# name -> (year range, genres); None is the full range / every genre, like a fresh session
+FILTERS = {
+    'all': (None, None),
+    'years': ((2005, 2010), None),
+    'one_genre': (None, ['rock']),
+    'genres_and_years': ((2000, 2015), ['pop', 'latin', 'jazz']),
+    'no_genre': (None, []),
+}
+
+# Filters the (slower) search and artist checks run under
+SEARCH_FILTERS = ('all', 'genres_and_years')
+
+# Broad and narrow terms, a term matching genres, one under 3 characters and one matching nothing
+SEARCH_TERMS = ['pop', 'love', 'tonight 1', 'artist 12', 'feat', 'r&b', 'la', 'zzz']
+ARTIST_TERMS = ['artist 1', 'artist 99', '7', 'zzz']
+
+
+# The original pandas logic of tubes_uas_streamlit.py
+
+def reference_preprocess(raw):
+    df = raw.loc[raw.groupby(['artist', 'song'])['popularity'].idxmax()]
+    df = df.drop_duplicates()
+    df = df[df['genre'] != 'set()']
+    df['genre'] = df['genre'].str.split(r'[;,]\s*')
+    df['duration'] = df['duration_ms'] / 60000
+    return df
+
+
+def reference_filter(df, year_filter, genre_filter):
+    return df[
+        (df['year'] >= year_filter[0]) &
+        (df['year'] <= year_filter[1]) &
+        (df['genre'].apply(lambda x: any(g in genre_filter for g in x)))
+    ]
+
+
+def reference_search(df, search_term):
+    return df[df['artist'].str.contains(search_term, case=False, na=False) |
+              df['song'].str.contains(search_term, case=False, na=False) |
+              df['genre'].apply(lambda genres: any(search_term.lower() in genre.lower() for genre in genres))]
+
+
+def reference_artists(df, artist_search_term):
+    return df[df['artist'].str.contains(artist_search_term, case=False, na=False)][['artist']].drop_duplicates()
+
+
+def reference_home(df):
+    exploded = df.explode('genre')
+    danceability = exploded.groupby('genre')['danceability']
+    return {
+        'total_songs': df.shape[0],
+        'total_artists': df['artist'].nunique(),
+        'total_genres': df['genre'].explode().nunique(),
+        'explicit': df[df['explicit'] == True].shape[0],  # noqa: E712
+        'non_explicit': df[df['explicit'] == False].shape[0],  # noqa: E712
+        'genre_counts': exploded.groupby('genre').size().reset_index(name='song_count'),
+        'genre_popularity': exploded.groupby('genre')['popularity'].sum().reset_index()
+                                    .rename(columns={'popularity': 'total_popularity'}),
+        'artist_counts': df.groupby('artist').size().reset_index(name='song_count'),
+        'annual_trends': df.groupby('year').agg(total_songs=('song', 'count'),
+                                                avg_popularity=('popularity', 'mean')).reset_index(),
+        'danceability': pd.DataFrame({
+            'genre': danceability.size().index,
+            'count': danceability.size().to_numpy(),
+            'min': danceability.min().to_numpy(),
+            'q1': danceability.quantile(0.25).to_numpy(),
+            'median': danceability.median().to_numpy(),
+            'q3': danceability.quantile(0.75).to_numpy(),
+            'max': danceability.max().to_numpy(),
+        }),
+    }
+
+
+def engine_home(view):
+    return {
+        'total_songs': view.total_songs,
+        'total_artists': view.total_artists,
+        'total_genres': view.total_genres,
+        'explicit': view.explicit_count,
+        'non_explicit': view.non_explicit_count,
+        'genre_counts': view.genre_counts(),
+        'genre_popularity': view.genre_popularity_sums(),
+        'artist_counts': view.artist_counts(),
+        'annual_trends': view.annual_trends(),
+        # The chart sorts genres itself; the summaries come in genre index order
+        'danceability': view.danceability_summaries().sort_values('genre'),
+    }
+
+
+# Comparisons; each returns None when equal, otherwise what differs
+
+def same_frame(expected, actual):
+    # Same rows and values; dtypes may differ in width (int32 counts, str vs object)
+    expected, actual = expected.reset_index(drop=True), actual.reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False, rtol=1e-12, atol=0)
+    except AssertionError as error:
+        return str(error).splitlines()[0]
+
+
+def same_labels(expected, actual, ordered=False):
+    expected, actual = np.asarray(expected), np.asarray(actual)
+    if not ordered:
+        expected, actual = np.sort(expected), np.sort(actual)
+    if len(expected) != len(actual):
+        return f"{len(actual)} rows instead of {len(expected)}"
+    if not np.array_equal(expected, actual):
+        return f"rows differ at position {int(np.flatnonzero(expected != actual)[0])}"
+
+
+def same_home(expected, actual):
+    for name, value in expected.items():
+        if isinstance(value, pd.DataFrame):
+            problem = same_frame(value, actual[name])
+        else:
+            problem = None if value == actual[name] else f"{actual[name]} instead of {value}"
+        if problem:
+            return f"{name}: {problem}"
+
+
+class Recorder:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = []
+        self.failures = 0
+
+    def measure(self, rows, phase, fn):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+        record = {'rows': rows, 'phase': phase, 'seconds': round(seconds, 6)}
+        if self.trace_memory:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base
+        self.results.append(record)
+        print(f"{rows:>10} {phase:<40} {seconds * 1000:10.1f} ms", file=sys.stderr)
+        return value
+
+    def size(self, rows, name, nbytes):
+        self.results.append({'rows': rows, 'size': name, 'bytes': int(nbytes)})
+        print(f"{rows:>10} {name:<40} {nbytes / 2**20:10.1f} MB", file=sys.stderr)
+
+    def check(self, rows, name, problem):
+        self.results.append({'rows': rows, 'check': name, 'ok': problem is None, **({'error': problem} if problem else {})})
+        if problem:
+            self.failures += 1
+            print(f"{rows:>10} {name:<40} FAILED: {problem}", file=sys.stderr)
+
+
+def check_size(rec, rows, path):
+    raw = rec.measure(rows, 'reference_read_csv', lambda: pd.read_csv(path))
+    df = rec.measure(rows, 'reference_preprocess', lambda: reference_preprocess(raw))
+    del raw
+
+    live = rec.measure(rows, 'load_dataset', lambda: LiveDataset(path, interval=0))
+    dataset = live.current
+    engine = dataset.engine
+    store = dataset.store
+    for name in ('genre_index', 'cube', 'artist_index', 'search_index'):
+        rec.measure(rows, f'build_{name}', lambda: dataset.member(name))
+
+    songs = rec.measure(rows, 'store_frame', store.frame)
+    rec.check(rows, 'preprocess', same_frame(df, songs) or same_labels(df.index, songs.index, ordered=True))
+    del songs
+    # Memory of the column store against the DataFrame the dashboard used to keep
+    rec.size(rows, 'song_store', store.nbytes())
+    rec.size(rows, 'reference_frame', df.memory_usage(deep=True).sum())
+
+    all_genres = df['genre'].explode().unique()
+    full_range = (int(df['year'].min()), int(df['year'].max()))
+    for filter_name, (year_range, genres) in FILTERS.items():
+        ref_range = full_range if year_range is None else year_range
+        ref_genres = all_genres if genres is None else genres
+
+        filtered = rec.measure(rows, f'reference_filter[{filter_name}]',
+                               lambda: reference_filter(df, ref_range, ref_genres))
+        mask = rec.measure(rows, f'filter[{filter_name}]', lambda: engine.mask(year_range, genres))
+        rec.check(rows, f'filter[{filter_name}]', same_labels(filtered.index, store.index[mask]))
+
+        expected = rec.measure(rows, f'reference_home[{filter_name}]', lambda: reference_home(filtered))
+        actual = rec.measure(rows, f'home[{filter_name}]', lambda: engine_home(engine.home(year_range, genres)))
+        rec.check(rows, f'home[{filter_name}]', same_home(expected, actual))
+
+        if filter_name not in SEARCH_FILTERS:
+            continue
+        for term in SEARCH_TERMS:
+            found = rec.measure(rows, f'reference_search[{filter_name}, {term}]', lambda: reference_search(filtered, term))
+            hits = rec.measure(rows, f'search[{filter_name}, {term}]', lambda: engine.search(term, year_range, genres))
+            # Most popular first, ties in table order
+            order = np.lexsort((np.arange(len(found)), -found['popularity'].to_numpy()))
+            rec.check(rows, f'search[{filter_name}, {term}]',
+                      same_labels(found.index[order], store.index[hits], ordered=True))
+        for term in ARTIST_TERMS:
+            found = rec.measure(rows, f'reference_artists[{filter_name}, {term}]',
+                                lambda: reference_artists(filtered, term))
+            names = rec.measure(rows, f'artists[{filter_name}, {term}]', lambda: engine.artists(term, year_range, genres))
+            rec.check(rows, f'artists[{filter_name}, {term}]', same_labels(found['artist'].to_numpy(dtype=object),
+                                                                         np.asarray(names, dtype=object)))
+
+        if len(filtered):
+            # Songs of the artist with the most songs, as the Search Artists page shows them
+            artist = filtered['artist'].value_counts().index[0]
+            expected = filtered[filtered['artist'] == artist]
+            profile = rec.measure(rows, f'artist_profile[{filter_name}]',
+                                  lambda: engine.artist_profile(artist, year_range, genres))
+            rows_of = store.index[dataset.artist_index.artist_rows(artist, engine.mask(year_range, genres))]
+            rec.check(rows, f'artist_profile[{filter_name}]',
+                      same_labels(expected.index, rows_of) or (None if profile.song_count == len(expected)
+                                                              else f"{profile.song_count} songs instead of {len(expected)}"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--workers', type=int, default=parallel.AGGREGATE_WORKERS,
+                        help='aggregation threads (SPOTIFY_AGGREGATE_WORKERS)')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='skip peak memory tracking (faster)')
+    args = parser.parse_args()
+
+    parallel.set_workers(args.workers)
+    rec = Recorder(trace_memory=not args.no_tracemalloc)
+    if rec.trace_memory:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_loader.SNAPSHOT_DIR = os.path.join(tmp, 'snapshots')
+        for rows in args.sizes:
+            path = os.path.join(tmp, f'songs_{rows}.csv')
+            rec.measure(rows, 'generate_csv', lambda: synthetic_data.write_csv(path, rows, seed=args.seed))
+            check_size(rec, rows, path)
+            os.remove(path)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'tracemalloc': rec.trace_memory,
+            'aggregate_workers': parallel.AGGREGATE_WORKERS,
+            'failures': rec.failures,
+        },
+        'results': rec.results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    print(f"{rec.failures} failed checks", file=sys.stderr)
+    sys.exit(1 if rec.failures else 0)
+
+
+if __name__ == '__main__':
+    main()
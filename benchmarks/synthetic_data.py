@@ -0,0 +1,194 @@
+# Synthetic song catalogues with the same columns as songs_normalize.csv
+#
+# The shape follows the real file: a few artists with many songs and a long tail with one or two,
+# genre strings weighted like the real ones ("pop", "hip hop, pop, R&B", ...) plus a tail of rare
+# combinations, about 1% 'set()' rows, re-released songs (the same artist and title again with
+# another year and popularity) and exact duplicate rows. Catalogues are generated in chunks, so
+# write_csv scales to tens of millions of rows in constant memory.
+#
+# Everything that belongs to a song (artist, title, genres, release year) is a hash of its id, so
+# a duplicate in a later chunk agrees with the song it repeats without keeping earlier chunks.
+from functools import lru_cache
+from itertools import permutations
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['artist', 'song', 'duration_ms', 'explicit', 'year', 'popularity', 'danceability', 'energy', 'key',
+           'loudness', 'mode', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
+           'genre']
+
+GENRES = ['pop', 'hip hop', 'R&B', 'Dance/Electronic', 'rock', 'metal', 'latin', 'country',
+          'Folk/Acoustic', 'easy listening', 'blues', 'jazz', 'World/Traditional', 'classical']
+
+# Genre strings of songs_normalize.csv with their counts there
+COMMON_GENRES = [
+    ('pop', 428), ('hip hop, pop', 277), ('hip hop, pop, R&B', 244), ('pop, Dance/Electronic', 221),
+    ('pop, R&B', 178), ('hip hop', 124), ('hip hop, pop, Dance/Electronic', 78), ('rock', 58), ('rock, pop', 43),
+    ('Dance/Electronic', 41), ('rock, metal', 38), ('pop, latin', 28), ('pop, rock', 26),
+    ('hip hop, Dance/Electronic', 16), ('latin', 15), ('pop, rock, metal', 14), ('hip hop, pop, latin', 14),
+    ('R&B', 13), ('pop, rock, Dance/Electronic', 13), ('country', 10), ('metal', 9), ('hip hop, pop, rock', 9),
+    ('pop, country', 8), ('pop, Folk/Acoustic', 8), ('rock, pop, Dance/Electronic', 8),
+    ('pop, R&B, Dance/Electronic', 6), ('rock, pop, metal', 4), ('hip hop, R&B', 3),
+    ('hip hop, pop, R&B, latin', 3), ('hip hop, pop, R&B, Dance/Electronic', 3),
+]
+
+# Every ordered list of 1 to 3 distinct genres, as it appears in the genre column
+GENRE_STRINGS = np.array([', '.join(p) for n in (1, 2, 3) for p in permutations(GENRES, n)], dtype=object)
+
+# Share of songs whose genres are a rare combination drawn from GENRE_STRINGS
+RARE_GENRES = 0.03
+
+# Share of rows with the 'set()' placeholder instead of genres
+NO_GENRE = 0.011
+
+# Share of rows repeating an earlier song (another year or popularity), and exact copies of a row
+REPEATS = 0.04
+EXACT_DUPLICATES = 0.03
+
+# Artists per row of the catalogue, and the Zipf exponent of their song counts
+ARTISTS_PER_ROW = 0.5
+ARTIST_SKEW = 0.8
+
+# Share of titles crediting a featured artist
+FEATURED = 0.05
+
+TITLE_WORDS = ['Love', 'Night', 'Tonight', 'Heart', 'Girl', 'Baby', 'Dance', 'Fire', 'Dream', 'Summer', 'Home',
+               'Money', 'Crazy', 'Forever', 'Light', 'Wild', 'Young', 'Gold', 'Rain', 'Party', 'Stay', 'Run',
+               'Boy', 'Time', 'Life', 'World', 'Sky', 'Star', 'Blue', 'Fly', 'Lost', 'Alive', 'Feel', 'Good',
+               'Bad', 'Real', 'Slow', 'High', 'Down', 'Hold', 'Free', 'Sweet']
+
+# Release years 1998..2020, few at both ends like the real file
+YEARS = np.arange(1998, 2021)
+YEAR_WEIGHTS = np.r_[1, 38, np.full(len(YEARS) - 3, 100), 3].astype(np.float64)
+
+# Rows per chunk written by write_csv
+CHUNK_ROWS = 1_000_000
+
+MASK = (1 << 64) - 1
+
+
+def hashed_uniform(ids, seed, salt):
+    # Uniform [0, 1) value per id (splitmix64), the same for an id whatever chunk it is in
+    x = ids.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64((seed * 1_000_003 + salt) & MASK)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def pick(cdf, u):
+    return np.minimum(np.searchsorted(cdf, u, side='right'), len(cdf) - 1)
+
+
+def cdf(weights):
+    weights = np.cumsum(weights, dtype=np.float64)
+    return weights / weights[-1]
+
+
+@lru_cache(maxsize=2)
+def artist_cdf(n_artists):
+    return cdf(np.arange(1, n_artists + 1, dtype=np.float64) ** -ARTIST_SKEW)
+
+
+GENRE_CDF = cdf([count for _, count in COMMON_GENRES])
+YEAR_CDF = cdf(YEAR_WEIGHTS)
+
+
+def beta(rng, mean, std, size):
+    k = mean * (1 - mean) / std ** 2 - 1
+    return rng.beta(mean * k, (1 - mean) * k, size=size)
+
+
+def songs(ids, seed, n_artists):
+    # Artist, title, genre string and release year of every song id
+    artists = artist_cdf(n_artists)
+    artist = pick(artists, hashed_uniform(ids, seed, 1))
+    words = np.array(TITLE_WORDS, dtype=object)
+    first = words[(hashed_uniform(ids, seed, 2) * len(words)).astype(np.int64)]
+    second = words[(hashed_uniform(ids, seed, 3) * len(words)).astype(np.int64)]
+    title = pd.Series(first, dtype=str) + ' ' + pd.Series(second, dtype=str) + ' ' + pd.Series(ids).astype(str)
+    featured = hashed_uniform(ids, seed, 4) < FEATURED
+    guest = pick(artists, hashed_uniform(ids[featured], seed, 5))
+    title[featured] = title[featured] + ' (feat. Artist ' + pd.Series(guest, index=title.index[featured]).astype(str) + ')'
+
+    u = hashed_uniform(ids, seed, 6)
+    genre = np.array([name for name, _ in COMMON_GENRES], dtype=object)[pick(GENRE_CDF, u / (1 - RARE_GENRES))]
+    rare = u >= 1 - RARE_GENRES
+    genre[rare] = GENRE_STRINGS[(hashed_uniform(ids[rare], seed, 7) * len(GENRE_STRINGS)).astype(np.int64)]
+
+    year = YEARS[pick(YEAR_CDF, hashed_uniform(ids, seed, 8))]
+    return 'Artist ' + pd.Series(artist).astype(str), title, genre, year
+
+
+def generate(rows, seed=0, start=0, catalogue_rows=None):
+    # One block of rows of a catalogue of catalogue_rows rows (start + rows by default);
+    # start is the position of the block, so blocks can be concatenated
+    catalogue_rows = max(catalogue_rows or start + rows, 1)
+    rng = np.random.default_rng([seed, start])
+    position = np.arange(start, start + rows)
+
+    # Repeats point back at a random earlier song, possibly in an earlier block
+    song = position.copy()
+    repeat = (rng.random(rows) < REPEATS) & (position > 0)
+    song[repeat] = rng.integers(0, np.maximum(position[repeat], 1))
+    artist, title, genre, year = songs(song, seed, max(int(catalogue_rows * ARTISTS_PER_ROW), 1))
+    # A re-release comes out the same year or a little later
+    year = np.minimum(year + repeat * rng.integers(0, 3, size=rows), YEARS[-1])
+    genre[rng.random(rows) < NO_GENRE] = 'set()'
+
+    # Popularity: most songs are hits around 65, re-releases and a tail of others score low
+    popularity = np.clip(np.rint(rng.normal(67, 10, size=rows)), 1, 89).astype(np.int64)
+    low = rng.random(rows) < np.where(repeat, 0.6, 0.08)
+    popularity[low] = rng.integers(0, 40, size=int(low.sum()))
+    popularity[low & (rng.random(rows) < 0.6)] = 0
+
+    instrumentalness = np.round(rng.lognormal(-9, 3, size=rows).clip(0, 0.99), 6)
+    instrumentalness[rng.random(rows) < 0.54] = 0
+
+    frame = pd.DataFrame({
+        'artist': artist,
+        'song': title,
+        'duration_ms': np.rint(rng.lognormal(np.log(223_000), 0.18, size=rows)).clip(90_000, 600_000).astype(np.int64),
+        'explicit': rng.random(rows) < 0.28,
+        'year': year,
+        'popularity': popularity,
+        'danceability': np.round(beta(rng, 0.667, 0.14, rows), 3),
+        'energy': np.round(beta(rng, 0.72, 0.15, rows), 3),
+        'key': rng.integers(0, 12, size=rows),
+        'loudness': np.round((-5.3 + rng.normal(0, 1.9, size=rows)).clip(-25, -0.1), 3),
+        'mode': (rng.random(rows) < 0.55).astype(np.int64),
+        'speechiness': np.round(rng.lognormal(np.log(0.06), 0.8, size=rows).clip(0.02, 0.95), 4),
+        'acousticness': np.round(rng.beta(0.45, 2.5, size=rows), 4),
+        'instrumentalness': instrumentalness,
+        'liveness': np.round(rng.lognormal(np.log(0.124), 0.6, size=rows).clip(0.015, 0.99), 4),
+        'valence': np.round(beta(rng, 0.55, 0.22, rows), 3),
+        'tempo': np.round(rng.normal(120, 27, size=rows).clip(60, 215), 3),
+        'genre': genre,
+    }, columns=COLUMNS)
+
+    # Exact copies of an earlier row of the block
+    source = np.arange(rows)
+    exact = np.flatnonzero(rng.random(rows) < EXACT_DUPLICATES)
+    exact = exact[exact > 0]
+    source[exact] = rng.integers(0, exact)
+    return frame.iloc[source].reset_index(drop=True)
+
+
+def write_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    # Written with pyarrow, several times faster than DataFrame.to_csv. The text differs in
+    # details (strings quoted, lowercase booleans, 0 for 0.0) but read_csv parses it the same
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    writer = None
+    for start in range(0, max(rows, 1), chunk_rows):
+        chunk = generate(min(chunk_rows, rows - start), seed=seed, start=start, catalogue_rows=rows)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pa_csv.CSVWriter(path, table.schema)
+        writer.write_table(table)
+    writer.close()
+    return path
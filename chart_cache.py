@@ -0,0 +1,102 @@
+import json
+
+import altair as alt
+import pandas as pd
+
+import chart_data
+from lru_cache import LRUCache
+
+# Marks drawn as one symbol per row, thinned when they have too many rows
+POINT_MARKS = ('point', 'circle', 'square')
+
+# Most bytes of records a chart may embed in its spec, whatever the number of filtered rows
+MAX_PAYLOAD_BYTES = 1 << 20
+
+
+def spec_size(spec):
+    return len(json.dumps(spec, default=str))
+
+
+def channel(chart, name):
+    # {'field': ..., 'type': ...} of an encoding channel, None when it is not a plain field
+    encoding = getattr(chart.encoding, name, alt.Undefined)
+    if encoding is alt.Undefined:
+        return None
+    encoding = encoding.to_dict(context={'data': chart.data})
+    return encoding if 'field' in encoding else None
+
+
+def thin_chart(chart, max_rows=chart_data.MAX_POINT_ROWS):
+    # Point charts with more than max_rows rows keep an LTTB selection of them, taken along x
+    # when it is quantitative, else in the order of y. Returns None for any other chart
+    data = chart.data
+    mark = chart.mark if isinstance(chart.mark, str) else chart.mark.type
+    x, y = channel(chart, 'x'), channel(chart, 'y')
+    if mark not in POINT_MARKS or y is None or y.get('type') != 'quantitative':
+        return None
+    if len(data) <= max_rows:
+        return chart
+    x = x['field'] if x is not None and x.get('type') == 'quantitative' else None
+    thinned, _ = chart_data.thin_points(data, y['field'], x, max_rows)
+    return chart.properties(data=thinned)
+
+
+def max_rows():
+    # Most rows Altair embeds in a spec before raising MaxRowsError
+    return alt.data_transformers.options.get('max_rows', 5000)
+
+
+def first_rows(data, max_bytes=MAX_PAYLOAD_BYTES):
+    # The first rows of data that Altair embeds and whose records fit in max_bytes
+    data = data.head(max_rows())
+    size = chart_data.payload_bytes(data)
+    while size > max_bytes and len(data) > 1:
+        data = data.head(max(int(len(data) * max_bytes / size), 1))
+        size = chart_data.payload_bytes(data)
+    return data
+
+
+def over_limit(part):
+    data = getattr(part, 'data', None)
+    return isinstance(data, pd.DataFrame) and (len(data) > max_rows() or chart_data.payload_bytes(data) > MAX_PAYLOAD_BYTES)
+
+
+def bounded(chart):
+    # Payload guard: a point chart is thinned to MAX_POINT_ROWS rows, and further if its records
+    # are still over MAX_PAYLOAD_BYTES. Every other chart, layers included, is built from
+    # aggregates; one that is still over the limit, or over the rows Altair embeds, keeps the first
+    # rows that fit, and is marked in its usermeta so the page can say the chart is capped
+    if isinstance(chart, alt.Chart) and isinstance(chart.data, pd.DataFrame):
+        thinned = thin_chart(chart)
+        if thinned is not None:
+            size = chart_data.payload_bytes(thinned.data)
+            if size > MAX_PAYLOAD_BYTES:
+                thinned = thin_chart(thinned, max(int(len(thinned.data) * MAX_PAYLOAD_BYTES / size), 3))
+            return thinned
+    cut = False
+    if over_limit(chart):
+        chart = chart.properties(data=first_rows(chart.data))
+        cut = True
+    layers = list(getattr(chart, 'layer', None) or [])
+    over = [over_limit(layer) for layer in layers]
+    if any(over):
+        chart = chart.copy()
+        chart.layer = [layer.properties(data=first_rows(layer.data)) if o else layer for layer, o in zip(layers, over)]
+        cut = True
+    return chart.properties(usermeta={'capped': True}) if cut else chart
+
+
+class ChartCache(LRUCache):
+    # Serialized Vega-Lite specs keyed by a fingerprint of the chart inputs, bounded in count and bytes
+
+    def __init__(self, maxsize=256, max_bytes=32 << 20):
+        super().__init__(maxsize=maxsize, max_weight=max_bytes, weigh=spec_size)
+
+    def spec(self, key, build):
+        # build() returns an Altair chart and only runs when the key is not cached yet
+        return self.get_or_create(key, lambda: bounded(build()).to_dict())
+
+    @staticmethod
+    def capped(spec):
+        # True when bounded() cut the data of the chart behind spec
+        return bool(spec.get('usermeta', {}).get('capped'))
@@ -0,0 +1,94 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+# Point marks above this many rows are thinned (see thin_points): past it the browser spends
+# more time drawing overlapping symbols than the extra points add
+MAX_POINT_ROWS = 2000
+
+
+def yearly_mean(df, column, name):
+    # One record per year instead of one per song, so Vega-Lite does not aggregate in the browser
+    return df.groupby('year')[column].mean().reset_index(name=name)
+
+
+def histogram_quantiles(counts, values, qs):
+    # Quantiles of the values behind a histogram, using linear interpolation like numpy and Vega
+    cum = np.cumsum(counts)
+    total = cum[-1] if len(cum) else 0
+    if not total:
+        return [np.nan] * len(qs)
+
+    result = []
+    for q in qs:
+        pos = (total - 1) * q
+        lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+        v_lo = values[np.searchsorted(cum, lo, side='right')]
+        v_hi = values[np.searchsorted(cum, hi, side='right')]
+        result.append(v_lo + (v_hi - v_lo) * (pos - lo))
+    return result
+
+
+def box_summaries(histograms, labels, values):
+    # Five-number summary (min, q1, median, q3, max) per label from a label x bin histogram matrix
+    records = []
+    for label, counts in zip(labels, histograms):
+        n = int(counts.sum())
+        if not n:
+            continue
+        present = np.flatnonzero(counts)
+        q1, median, q3 = histogram_quantiles(counts, values, (0.25, 0.5, 0.75))
+        records.append({
+            'genre': label, 'count': n,
+            'min': values[present[0]], 'q1': q1, 'median': median, 'q3': q3, 'max': values[present[-1]],
+        })
+    return pd.DataFrame(records, columns=['genre', 'count', 'min', 'q1', 'median', 'q3', 'max'])
+
+
+def payload_bytes(frame):
+    # Size of the records as they are embedded in the chart spec
+    return len(json.dumps(frame.to_dict(orient='records'), default=str))
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: positions of n_out points of the series (sorted by x) that keep
+    # its visual shape, peaks and dips included, unlike evenly spaced picks. The first and last
+    # points are kept; every bucket in between keeps the point spanning the largest triangle with
+    # the point kept before it and the mean of the next bucket
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    bounds = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        next_stop = bounds[i + 2] if i + 2 < len(bounds) else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = keep[i + 1] = start + int(np.argmax(area))
+    return keep
+
+
+def thin_points(frame, y, x=None, max_rows=MAX_POINT_ROWS):
+    # Keep point charts bounded: an LTTB selection of the rows when there are too many, plus a flag
+    # saying so. Without a numeric x the points are taken in the order of y, the way the charts
+    # sort their nominal axis (e.g. songs by loudness)
+    if len(frame) <= max_rows:
+        return frame, False
+    values = frame[y].to_numpy(dtype=np.float64)
+    if x is None:
+        order = np.argsort(-values, kind='stable')
+        xs = np.arange(len(frame))
+    else:
+        order = np.argsort(frame[x].to_numpy(dtype=np.float64), kind='stable')
+        xs = frame[x].to_numpy(dtype=np.float64)[order]
+    keep = order[lttb(xs, values[order], max_rows)]
+    return frame.iloc[np.sort(keep)], True
@@ -0,0 +1,314 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# CSV the dashboard reads, overridable for benchmarks and other deployments
+DATASET_PATH = os.environ.get("SPOTIFY_DATASET", "songs_normalize.csv")
+
+# Directory where ingest snapshots are written, next to the app by default
+SNAPSHOT_DIR = os.environ.get("SPOTIFY_SNAPSHOT_DIR", ".snapshots")
+
+# Bump this whenever best_rows() / clean() or the snapshot layout change so old snapshots are not reused
+SNAPSHOT_VERSION = 3
+
+# Rows parsed at a time; peak memory is about one chunk plus the unique songs seen so far (and no
+# more replaced rows than that, see IngestState)
+CHUNK_SIZE = 200_000
+
+# Always parsed as text: a chunk that only holds a title like "22" would otherwise get a numeric
+# song column, which neither dedups against the same title read as text nor writes to Parquet
+TEXT_COLUMNS = ('artist', 'song', 'genre')
+
+
+def file_fingerprint(path):
+    # Cheap key checked on every rerun: any rewrite of the file changes mtime or size
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    # Content hash, only computed when the fingerprint changes
+    return prefix_digest(path, chunk_size=chunk_size).hexdigest()
+
+
+def prefix_digest(path, size=None, chunk_size=1 << 20):
+    # Running hash of the first size bytes of the file (all of it by default)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        remaining = float('inf') if size is None else size
+        while remaining > 0:
+            block = f.read(int(min(chunk_size, remaining)))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def best_rows(raw):
+    # Drop duplicates, keeping the row with the maximum popularity (the first one on ties)
+    return raw.loc[raw.groupby(['artist', 'song'])['popularity'].idxmax()]
+
+
+def song_keys(raw):
+    # 64-bit hash of (artist, song) per row, the same for a chunk of the CSV and a loaded snapshot
+    return pd.util.hash_pandas_object(raw[['artist', 'song']], index=False).to_numpy()
+
+
+def clean(df):
+    # Drop any remaining duplicates and songs without a genre
+    df = df.drop_duplicates()
+    df = df[df['genre'] != 'set()'].copy()
+    df['genre'] = df['genre'].str.split(r'[;,]\s*')
+
+    df['duration'] = df['duration_ms'] / 60000  # Convert duration from milliseconds to minutes
+    return df
+
+
+def preprocess(raw):
+    return clean(best_rows(raw))
+
+
+def complete_end(f, start, size, block_size=1 << 16):
+    # Position just after the last newline, so a line that is still being written is left for later
+    pos = size
+    while pos > start:
+        step = min(block_size, pos - start)
+        f.seek(pos - step)
+        newline = f.read(step).rfind(b'\n')
+        if newline >= 0:
+            return pos - step + newline + 1
+        pos -= step
+    return start
+
+
+class PrefixReader(io.RawIOBase):
+    # Reads a binary file up to end, feeding every byte to a running hash
+
+    def __init__(self, f, end, digest):
+        self.f = f
+        self.end = end
+        self.digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.end - self.f.tell())
+        if n <= 0:
+            return 0
+        data = self.f.read(n)
+        buffer[:len(data)] = data
+        self.digest.update(data)
+        return len(data)
+
+
+class IngestState:
+    # Running dedup table of a CSV: the best raw row per (artist, song) over every row read so far,
+    # 'set()' rows included since a later row can still replace them. Rows keep their position
+    # in the file as index, the same labels read_csv gives when the whole file is read at once.
+    #
+    # The table is kept in parts instead of one frame, so a chunk costs the same however many songs
+    # came before it: the frame of each chunk's best rows (or of a loaded snapshot), a mask of its
+    # rows that are still best, and where each song's best row is. A song whose row a chunk replaces
+    # or keeps moves to that chunk's frame. table() joins the parts once, for songs() and save().
+
+    def __init__(self, columns=None, best=None, rows=0, offset=0):
+        self.columns = columns
+        self.rows = rows
+        self.offset = offset
+        self.parts = []
+        self.alive = []
+        # Position of the first row of each part in the parts laid end to end, and one past the last
+        self.starts = [0]
+        self.dead_rows = 0
+        # Hash of (artist, song) -> position of its best row; built on the first add() after a load
+        self.positions = None
+        if best is not None:
+            self.append(best)
+        # File size when the last read held back an unterminated last line
+        self.held_size = None
+        self.digest = hashlib.sha1()
+        self.prefix_hash = None
+        # Labels of best rows replaced during the last read()
+        self.replaced = []
+
+    def append(self, part):
+        if self.positions is not None:
+            self.positions.update(zip(song_keys(part).tolist(), range(self.starts[-1], self.starts[-1] + len(part))))
+        self.parts.append(part)
+        self.alive.append(np.ones(len(part), dtype=bool))
+        self.starts.append(self.starts[-1] + len(part))
+
+    def index(self):
+        if self.positions is None:
+            self.positions = {}
+            for part, start in zip(self.parts, self.starts):
+                self.positions.update(zip(song_keys(part).tolist(), range(start, start + len(part))))
+        return self.positions
+
+    def take(self, positions):
+        # The rows at positions, which stop being best rows of their parts
+        part_of = np.searchsorted(self.starts, positions, side='right') - 1
+        taken = []
+        for number in np.unique(part_of):
+            rows = positions[part_of == number] - self.starts[number]
+            self.alive[number][rows] = False
+            taken.append(self.parts[number].iloc[rows])
+        self.dead_rows += len(positions)
+        return taken
+
+    def table(self):
+        # The best rows as one frame, in the order they were last added
+        return pd.concat([part if alive.all() else part[alive] for part, alive in zip(self.parts, self.alive)])
+
+    def add(self, chunk):
+        chunk.index = pd.RangeIndex(self.rows, self.rows + len(chunk))
+        self.rows += len(chunk)
+
+        # Only songs that occur in the chunk can change, dedup those against their current best row.
+        # Earlier rows come first, so idxmax still keeps the first row on ties
+        positions = self.index()
+        found = [positions.get(key) for key in np.unique(song_keys(chunk)).tolist()]
+        touched = self.take(np.array([position for position in found if position is not None], dtype=np.int64))
+        if touched:
+            old = pd.concat(touched)
+            merged = best_rows(pd.concat([old, chunk]))
+            self.replaced.append(old.index.difference(merged.index))
+        else:
+            merged = best_rows(chunk)
+            self.replaced.append(pd.Index([], dtype=np.int64))
+        self.append(merged)
+
+        # Rewrite the parts as one frame once most of what they hold has been replaced
+        if self.dead_rows > self.starts[-1] - self.dead_rows:
+            best = self.table()
+            self.parts, self.alive, self.starts, self.dead_rows, self.positions = [], [], [0], 0, None
+            self.append(best)
+
+    def read(self, path, chunk_size=CHUNK_SIZE, hold_partial=False):
+        # Ingest the lines added since the last read; returns how many rows were added. A last line
+        # without a newline is read too, unless hold_partial: then it may still be being written
+        # and is left for a later read, until the file size has stopped changing
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            end = size
+            if hold_partial:
+                end = complete_end(f, self.offset, size)
+                if end < size and size == self.held_size:
+                    end = size
+                self.held_size = size if end < size else None
+            if end <= self.offset:
+                return 0
+            f.seek(self.offset)
+            reader = io.BufferedReader(PrefixReader(f, end, self.digest))
+            if self.columns is None:
+                self.columns = list(pd.read_csv(io.BytesIO(reader.readline()), nrows=0).columns)
+
+            rows = self.rows
+            self.replaced = []
+            try:
+                dtype = {column: str for column in TEXT_COLUMNS if column in self.columns}
+                for chunk in pd.read_csv(reader, header=None, names=self.columns, dtype=dtype, chunksize=chunk_size):
+                    self.add(chunk)
+            except pd.errors.EmptyDataError:
+                pass
+            self.offset = end
+            self.prefix_hash = self.digest.hexdigest()
+        return self.rows - rows
+
+    def changes(self, path):
+        # Read what was appended to path. Returns the labels of the best rows that were replaced
+        # and the preprocessed rows that replaced them or are new songs (None when nothing was read)
+        rows = self.rows
+        if not self.read(path, hold_partial=True):
+            return pd.Index([]), None
+        # Rows read now can also be replaced by later rows of the same read, leave those out
+        removed = pd.Index(np.concatenate([labels[labels < rows] for labels in self.replaced]))
+        added = [part[alive & (part.index >= rows)] for part, alive in zip(self.parts, self.alive)]
+        return removed, clean(pd.concat(added))
+
+    def resume(self, path):
+        # True when the file still starts with the bytes read so far, i.e. it was only appended to
+        if os.path.getsize(path) < self.offset:
+            return False
+        digest = prefix_digest(path, self.offset)
+        if digest.hexdigest() != self.prefix_hash:
+            return False
+        self.digest = digest
+        return True
+
+    def songs(self):
+        # In (artist, song) order, like the groupby of preprocess()
+        return clean(self.table().sort_values(['artist', 'song'], kind='stable'))
+
+    def save(self, target):
+        # The table gets a new file name each time and the JSON pointing at it is replaced last,
+        # so readers never pair new metadata with an old or half-written table
+        directory = os.path.dirname(target) or '.'
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.basename(target)[:-len('.json')]
+        table = f"{stem}-{self.digest.hexdigest()[:16]}.parquet"
+        tmp = os.path.join(directory, f"{table}.{os.getpid()}.tmp")
+        self.table().to_parquet(tmp, index=True)
+        os.replace(tmp, os.path.join(directory, table))
+
+        meta = {'columns': self.columns, 'rows': self.rows, 'offset': self.offset,
+                'prefix_hash': self.digest.hexdigest(), 'table': table}
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, target)
+
+        # Remove tables of older states of the same file
+        for name in os.listdir(directory):
+            if name.startswith(stem + '-') and name.endswith('.parquet') and name != table:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, target):
+        try:
+            with open(target) as f:
+                meta = json.load(f)
+            # Memory-map the Parquet file instead of reading it through a buffer
+            best = pd.read_parquet(os.path.join(os.path.dirname(target), meta['table']), memory_map=True)
+        except Exception:
+            # Missing, corrupt or unreadable snapshot
+            return None
+        state = cls(meta['columns'], best, meta['rows'], meta['offset'])
+        state.prefix_hash = meta['prefix_hash']
+        return state
+
+
+def snapshot_path(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR, f"{stem}-v{SNAPSHOT_VERSION}.json")
+
+
+def open_state(path):
+    # Ingest state of path brought up to date, reading only the rows appended since the last snapshot
+    target = snapshot_path(path)
+    state = IngestState.load(target)
+    if state is None or not state.resume(path):
+        # No snapshot, or the file was rewritten rather than appended to
+        state = IngestState()
+
+    if state.read(path) or not os.path.exists(target):
+        try:
+            state.save(target)
+        except OSError:
+            # Read-only deployments still work, they just parse the CSV on every process start
+            pass
+    return state
+
+
+def load_songs(path):
+    # Return the preprocessed song table
+    return open_state(path).songs()
@@ -0,0 +1,128 @@
+import io
+import os
+import tempfile
+from urllib.parse import urlencode
+
+import pandas as pd
+
+# Rows materialized at a time while exporting; memory stays at one chunk whatever the row count
+EXPORT_CHUNK_ROWS = 50_000
+
+# Largest table offered as an in-app download: Streamlit reads a download into memory in full when
+# it is clicked. Bigger tables link to the chunked /export endpoint of query_api.py instead, when
+# SPOTIFY_EXPORT_URL gives the address the API is reachable at
+APP_EXPORT_MAX_ROWS = int(os.environ.get("SPOTIFY_APP_EXPORT_MAX_ROWS", "200000"))
+EXPORT_URL = os.environ.get("SPOTIFY_EXPORT_URL", "")
+
+# Label shown in the app -> (file extension, MIME type)
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'JSON lines': ('jsonl', 'application/x-ndjson'),
+}
+
+
+def frames(view, chunk_rows=EXPORT_CHUNK_ROWS):
+    # The rows of a SongView as DataFrames of at most chunk_rows rows
+    for start in range(0, len(view), chunk_rows):
+        yield view.frame(start, start + chunk_rows)
+
+
+def csv_chunks(view, chunk_rows=EXPORT_CHUNK_ROWS):
+    header = True
+    for frame in frames(view, chunk_rows):
+        # CSV has no lists, write genres back the way the source file does
+        frame = frame.assign(genre=frame['genre'].str.join(', '))
+        yield frame.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+    if header:
+        yield (','.join(view.store.columns) + '\n').encode('utf-8')
+
+
+def jsonl_chunks(view, chunk_rows=EXPORT_CHUNK_ROWS):
+    for frame in frames(view, chunk_rows):
+        text = frame.to_json(orient='records', lines=True)
+        yield (text if text.endswith('\n') else text + '\n').encode('utf-8')
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file that hands back what was written since the last drain(); tell() keeps
+    # counting from the start, which the Parquet footer offsets rely on
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(view, chunk_rows=EXPORT_CHUNK_ROWS):
+    # One row group per chunk
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer = None
+    for frame in frames(view, chunk_rows) if len(view) else [view.frame()]:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {'csv': csv_chunks, 'parquet': parquet_chunks, 'jsonl': jsonl_chunks}
+
+
+def stream(view, extension, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Export of the view in the given format, as a generator of byte strings
+    return WRITERS[extension](view, chunk_rows)
+
+
+def export_file(view, extension, chunk_rows=EXPORT_CHUNK_ROWS):
+    # Export written chunk by chunk to an anonymous temporary file, rewound for reading
+    f = tempfile.TemporaryFile()
+    for data in stream(view, extension, chunk_rows):
+        f.write(data)
+    f.seek(0)
+    return f
+
+
+def export_bytes(view, extension, chunk_rows=EXPORT_CHUNK_ROWS):
+    # The whole export for Streamlit's download button; the temporary file is closed once read
+    with export_file(view, extension, chunk_rows) as f:
+        return f.read()
+
+
+def export_url(base, extension, year_range, genres=None):
+    # Link to the same export from query_api.py, genres None standing for all of them
+    params = [('format', extension), ('year_from', year_range[0]), ('year_to', year_range[1])]
+    params += [('genre', genre) for genre in genres or ()]
+    return f"{base.rstrip('/')}/export?{urlencode(params)}"
+
+
+def chart_frame(spec):
+    # Data behind a Vega-Lite spec: its first dataset holds the chart's rows, later ones only
+    # decorations such as the donut's centre label
+    datasets = list(spec.get('datasets', {}).values())
+    return pd.DataFrame(datasets[0] if datasets else [])
+
+
+def chart_csv(spec):
+    return chart_frame(spec).to_csv(index=False).encode('utf-8')
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+
+class GenreIndex:
+    # Genre code table plus a song x genre membership bitset, one row of 64-bit words per song
+
+    def __init__(self, genre_lists):
+        lengths = genre_lists.map(len).to_numpy()
+        exploded = genre_lists.explode()
+        row_pos = np.repeat(np.arange(len(genre_lists)), lengths)
+
+        valid = exploded.notna().to_numpy()
+        # Codes follow the order of first appearance, same as explode().unique()
+        codes, genres = pd.factorize(exploded[valid])
+        self._build(len(genre_lists), row_pos[valid], codes, genres)
+
+    @classmethod
+    def from_store(cls, store):
+        # Reuse the store's CSR genre codes, they are coded the same way; rows that are no longer
+        # live get no genre bits, so no filter ever selects them
+        rows = store.genre_rows()
+        live = store.live[rows]
+        index = cls.__new__(cls)
+        index._build(len(store), rows[live], store.genre_codes[live].astype(np.int64), store.genres)
+        return index
+
+    def updated(self, store, removed, start):
+        # Index of a store extended from this one: rows from start on are new, rows in removed are dead
+        first = store.genre_offsets[start]
+        rows = np.repeat(np.arange(len(store) - start), np.diff(store.genre_offsets[start:]))
+        index = GenreIndex.__new__(GenreIndex)
+        index._build(len(store) - start, rows, store.genre_codes[first:].astype(np.int64), store.genres)
+
+        bits = np.zeros((len(store), index.n_words), dtype=np.uint64)
+        bits[:start, :self.n_words] = self.bits
+        bits[start:] = index.bits
+        bits[removed] = 0
+        index.bits = bits
+        index.has_genre = (bits != 0).any(axis=1)
+        return index
+
+    def _build(self, n_rows, row_pos, codes, genres):
+        self.genres = np.asarray(genres, dtype=object)
+        self.codes = {genre: code for code, genre in enumerate(self.genres)}
+        self.n_words = max(1, (len(self.genres) + 63) // 64)
+
+        # Set bit (code % 64) of word (code // 64) for every (song, genre) pair
+        bits = np.zeros((n_rows, self.n_words), dtype=np.uint64)
+        np.bitwise_or.at(bits, (row_pos, codes // 64), np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64)))
+        self.bits = bits
+        self.has_genre = (bits != 0).any(axis=1)
+
+    def selection_words(self, selected_genres):
+        words = np.zeros(self.n_words, dtype=np.uint64)
+        for genre in selected_genres:
+            code = self.codes.get(genre)
+            if code is not None:
+                words[code // 64] |= np.uint64(1) << np.uint64(code % 64)
+        return words
+
+    def all_selected(self, selected_genres):
+        return len(selected_genres) >= len(self.genres) and all(g in selected_genres for g in self.genres)
+
+    def selection_key(self, selected_genres):
+        # Hashable cache key for a genre selection
+        selected_genres = set(selected_genres)
+        return 'all' if self.all_selected(selected_genres) else tuple(sorted(selected_genres))
+
+    def genre_mask(self, selected_genres):
+        # Songs that have at least one of the selected genres
+        selected_genres = set(selected_genres)
+        if self.all_selected(selected_genres):
+            return self.has_genre
+        if not selected_genres:
+            return np.zeros(len(self.bits), dtype=bool)
+
+        words = self.selection_words(selected_genres)
+        if self.n_words == 1:
+            return (self.bits[:, 0] & words[0]) != 0
+        return (self.bits & words).any(axis=1)
+
+    def filter_mask(self, years, year_range, selected_genres):
+        # Year range plus genre set filter as a single boolean mask
+        mask = (years >= year_range[0]) & (years <= year_range[1])
+        return mask & self.genre_mask(selected_genres)
@@ -0,0 +1,152 @@
+import altair as alt
+import pandas as pd
+
+# Charts of the home page, each built from a CubeView rollup (see aggregates.py) so they can
+# also be computed outside a script run, e.g. by the startup warm-up
+
+
+def make_donut(explicit_count, non_explicit_count, input_color):
+    if input_color == 'green':
+        chart_color = ['#E74C3C', '#1DB954']
+
+    # No songs under the filters: 0% and an empty ring
+    total = max(explicit_count + non_explicit_count, 1)
+    explicit_percentage = explicit_count / total * 100
+    non_explicit_percentage = non_explicit_count / total * 100
+
+    source = pd.DataFrame({
+        "Status": ["Explicit", "Non-Explicit"],
+        "Value": [explicit_count, non_explicit_count],
+        "Percentage": [explicit_percentage, non_explicit_percentage]
+    })
+
+    plot = alt.Chart(source).mark_arc(innerRadius=70, outerRadius=85, cornerRadius=10).encode(
+        theta=alt.Theta(field="Value", type="quantitative"),
+        color=alt.Color("Status:N",
+                        scale=alt.Scale(
+                            domain=["Explicit", "Non-Explicit"],
+                            range=chart_color),
+                        legend=None),
+        tooltip=[alt.Tooltip("Status:N"), alt.Tooltip("Value:Q"), alt.Tooltip("Percentage:Q", format=".1f")]
+    ).properties(width=220, height=220)
+
+    text = alt.Chart(pd.DataFrame({'text': [f'{non_explicit_percentage:.1f}%']})).mark_text(
+        align='center', fontSize=30, fontWeight=600, color='#1DB954'
+    ).encode(
+        text='text:N'
+    ).properties(width=220, height=220)
+
+    return plot + text
+
+
+def genre_chart(home):
+    genre_count = home.genre_counts()
+    top_10_genres = genre_count.sort_values(by='song_count', ascending=False).head(8)
+
+    return alt.Chart(top_10_genres).mark_bar(color='#1DB954').encode(
+        x=alt.X('genre:N', title='Genre', sort='-y'),
+        y=alt.Y('song_count:Q', title='Number of Songs'),
+        tooltip=['genre:N', 'song_count:Q']
+    ).properties(
+        width=500,
+        height=280
+    ).configure_title(
+        fontSize=20,
+        anchor='start',
+        font='Arial'
+    ).configure_axis(
+        labelFontSize=12,
+        titleFontSize=14
+    )
+
+
+def donut_chart(home):
+    # Create the chart with green color scheme
+    return make_donut(home.explicit_count, home.non_explicit_count, 'green')
+
+
+def artist_chart(home):
+    # Total songs per artist
+    artist_song_count = home.artist_counts()
+    top_artists_by_songs = artist_song_count.sort_values(by='song_count', ascending=False).head(5)  # Top 5 artists
+
+    return alt.Chart(top_artists_by_songs).mark_bar(color='#1DB954').encode(
+        x=alt.X('song_count:Q', title='Number of Songs'),
+        y=alt.Y('artist:N', sort='-x', title='Artist'),
+        tooltip=['artist:N', 'song_count:Q']
+    ).properties(
+        width=400,
+        height=280
+    )
+
+
+def songs_trend_chart(home):
+    # Line chart for the total number of songs released per year
+    annual_trends = home.annual_trends()
+
+    return alt.Chart(annual_trends).mark_line(color='#1DB954', point=True).encode(
+        x=alt.X('year:O', title='Year'),
+        y=alt.Y('total_songs:Q', title='Total Songs Released'),
+        tooltip=['year:O', 'total_songs:Q']
+    ).properties(
+        width=400,
+        height=280
+    )
+
+
+def top_genres_vertical_chart(home):
+    # Calculate the total popularity for each genre
+    genre_popularity = home.genre_popularity_sums()
+
+    # Sort genres by popularity and select the top 10
+    top_genres = genre_popularity.sort_values(by='total_popularity', ascending=False).head(10)
+
+    return alt.Chart(top_genres).mark_line(point=True, color='#1DB954').encode(
+        x=alt.X('genre:N', title='Genre', sort='-y'),
+        y=alt.Y('total_popularity:Q', title='Total Popularity'),
+        tooltip=[
+            alt.Tooltip('genre:N', title='Genre'),
+            alt.Tooltip('total_popularity:Q', title='Total Popularity', format='.2f')
+        ]
+    ).properties(
+        width=500,
+        height=380
+    )
+
+
+def danceability_boxplot(home):
+    # Five-number summary per genre computed server-side, one record per genre
+    danceability_summary = home.danceability_summaries()
+
+    # Boxplot drawn from the summary: min-max whisker, q1-q3 box and median tick
+    danceability_base = alt.Chart(danceability_summary).encode(
+        y=alt.Y('genre:N', title='Genre', sort=alt.EncodingSortField(field='median', order='descending')),
+        color=alt.Color('genre:N', legend=None),  # Use the default color for genres
+        tooltip=[
+            alt.Tooltip('genre:N', title='Genre'),
+            alt.Tooltip('min:Q', title='Min'),
+            alt.Tooltip('q1:Q', title='Q1'),
+            alt.Tooltip('median:Q', title='Median'),
+            alt.Tooltip('q3:Q', title='Q3'),
+            alt.Tooltip('max:Q', title='Max')
+        ]
+    )
+    return alt.layer(
+        danceability_base.mark_rule().encode(x=alt.X('min:Q', title='Danceability'), x2='max:Q'),
+        danceability_base.mark_bar(size=14).encode(x='q1:Q', x2='q3:Q'),
+        danceability_base.mark_tick(color='white', size=14).encode(x='median:Q')
+    ).properties(
+        width=500,
+        height=380
+    )
+
+
+# Cache key names of the charts above, in page order
+HOME_CHARTS = {
+    'genre_chart': genre_chart,
+    'donut_chart': donut_chart,
+    'artist_chart': artist_chart,
+    'songs_trend_chart': songs_trend_chart,
+    'top_genres_vertical_chart': top_genres_vertical_chart,
+    'danceability_boxplot': danceability_boxplot,
+}
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Opt-in: set SPOTIFY_INSTRUMENT=1, or open the app with ?debug=1
+ENABLED = os.environ.get("SPOTIFY_INSTRUMENT", "") not in ("", "0")
+
+# When set, the Prometheus text exposition is rewritten here after every instrumented rerun
+# (e.g. for node_exporter's textfile collector)
+METRICS_FILE = os.environ.get("SPOTIFY_METRICS_FILE")
+
+# Upper bounds (seconds) of the section latency histogram
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger("dashboard.instrumentation")
+
+
+class Registry:
+    # Process-wide totals per section, shared by every session
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sections = {}
+
+    def observe(self, record):
+        with self._lock:
+            totals = self._sections.setdefault(record['section'], {
+                'count': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'payload_bytes': 0,
+                'buckets': [0] * len(BUCKETS),
+            })
+            totals['count'] += 1
+            totals['seconds'] += record['seconds']
+            for field in ('rows_in', 'rows_out', 'payload_bytes'):
+                totals[field] += record.get(field) or 0
+            for i, bound in enumerate(BUCKETS):
+                if record['seconds'] <= bound:
+                    totals['buckets'][i] += 1
+
+    def prometheus_text(self):
+        lines = [
+            '# HELP dashboard_section_seconds Wall time spent in a dashboard section per rerun.',
+            '# TYPE dashboard_section_seconds histogram',
+        ]
+        with self._lock:
+            sections = {name: dict(totals, buckets=list(totals['buckets'])) for name, totals in self._sections.items()}
+        for name, totals in sorted(sections.items()):
+            label = f'section="{name}"'
+            for bound, count in zip(BUCKETS, totals['buckets']):
+                lines.append(f'dashboard_section_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'dashboard_section_seconds_bucket{{{label},le="+Inf"}} {totals["count"]}')
+            lines.append(f'dashboard_section_seconds_sum{{{label}}} {totals["seconds"]:.6f}')
+            lines.append(f'dashboard_section_seconds_count{{{label}}} {totals["count"]}')
+        for field, help_text in (('rows_in', 'Rows read by a section.'),
+                                 ('rows_out', 'Rows produced by a section.'),
+                                 ('payload_bytes', 'Bytes sent to the browser by a section.')):
+            lines.append(f'# HELP dashboard_section_{field}_total {help_text}')
+            lines.append(f'# TYPE dashboard_section_{field}_total counter')
+            for name, totals in sorted(sections.items()):
+                lines.append(f'dashboard_section_{field}_total{{section="{name}"}} {totals[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # Atomic rewrite so the collector never reads a partial file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+class RerunTrace:
+    # Section timings of one script rerun; does nothing unless enabled
+
+    def __init__(self, enabled, view=None):
+        self.enabled = enabled
+        self.view = view
+        self.records = []
+        self.started = time.perf_counter()
+
+    def start(self, name, rows_in=None):
+        return {'section': name, 'rows_in': rows_in, 'rows_out': None, 'payload_bytes': None,
+                'started': time.perf_counter()}
+
+    def stop(self, record, **fields):
+        # fields can set rows_out / payload_bytes
+        if not self.enabled:
+            return
+        record.update(fields)
+        record['seconds'] = time.perf_counter() - record.pop('started')
+        self.records.append(record)
+
+    @contextmanager
+    def section(self, name, rows_in=None):
+        # The yielded dict can be filled with rows_out / payload_bytes inside the block
+        record = self.start(name, rows_in)
+        try:
+            yield record
+        finally:
+            self.stop(record)
+
+    def frame(self):
+        columns = ['section', 'seconds', 'rows_in', 'rows_out', 'payload_bytes']
+        frame = pd.DataFrame(self.records, columns=columns)
+        frame['ms'] = (frame['seconds'] * 1000).round(2)
+        return frame.drop(columns='seconds')[['section', 'ms', 'rows_in', 'rows_out', 'payload_bytes']]
+
+    def finish(self):
+        # Publish the rerun: registry totals, one structured log line, optional Prometheus file
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.started
+        for record in self.records:
+            registry.observe(record)
+        registry.observe({'section': 'rerun', 'seconds': total})
+        logger.info(json.dumps({'event': 'rerun', 'view': self.view, 'seconds': round(total, 6), 'sections': self.records}))
+        if METRICS_FILE:
+            try:
+                registry.write_prometheus(METRICS_FILE)
+            except OSError:
+                logger.exception("could not write %s", METRICS_FILE)
+        return total
@@ -0,0 +1,195 @@
+# Versioned song table with its derived indexes, refreshed when the CSV changes
+#
+# Every rerun takes the current Dataset once and reads everything from it. A refresh builds the
+# next Dataset on the side and then swaps the reference, so sessions in flight keep a consistent
+# version while the new one is prepared.
+#
+# With SPOTIFY_REFRESH_INTERVAL set, a watcher thread polls the CSV. Rows appended to it are
+# deduplicated against the ingest state kept in memory and applied as a delta: the store grows,
+# replaced rows stop being live, and the indexes that were already built are updated from the
+# previous version instead of being rebuilt. A file that was rewritten rather than appended to
+# is loaded in full, the same way as without the watcher.
+import logging
+import os
+import threading
+import time
+
+import data_loader
+import shared_store
+from aggregates import SongCube
+from artist_index import ArtistIndex
+from chart_cache import ChartCache
+from genre_index import GenreIndex
+from query_engine import QueryEngine
+from search_index import SearchIndex
+from similar_songs import SimilarSongs
+from song_store import SongStore
+
+# Seconds between checks of the CSV; 0 disables the watcher and checks on every rerun instead
+REFRESH_INTERVAL = float(os.environ.get("SPOTIFY_REFRESH_INTERVAL", "0"))
+
+logger = logging.getLogger("dashboard.refresh")
+
+BUILDERS = {
+    'genre_index': lambda dataset: GenreIndex.from_store(dataset.store),
+    'cube': lambda dataset: SongCube(dataset.store, dataset.genre_index),
+    'artist_index': lambda dataset: ArtistIndex(dataset.store),
+    'search_index': lambda dataset: SearchIndex.from_store(dataset.store),
+    # Standardized audio features; rebuilt per version since the standardization changes too
+    'similar_songs': lambda dataset: SimilarSongs(dataset.store),
+    # Vega-Lite specs of this version, keyed by chart and filter state
+    'chart_cache': lambda dataset: ChartCache(),
+    'engine': QueryEngine,
+}
+
+
+class Dataset:
+    # One version of the song table. Indexes are built on first use and never change afterwards.
+
+    def __init__(self, version, store):
+        self.version = version
+        self.store = store
+        self.built = {}
+        self.locks = {name: threading.Lock() for name in BUILDERS}
+
+    def member(self, name):
+        value = self.built.get(name)
+        if value is None:
+            with self.locks[name]:
+                value = self.built.get(name)
+                if value is None:
+                    value = self.built[name] = BUILDERS[name](self)
+        return value
+
+    @property
+    def genre_index(self):
+        return self.member('genre_index')
+
+    @property
+    def cube(self):
+        return self.member('cube')
+
+    @property
+    def artist_index(self):
+        return self.member('artist_index')
+
+    @property
+    def search_index(self):
+        return self.member('search_index')
+
+    @property
+    def similar_songs(self):
+        return self.member('similar_songs')
+
+    @property
+    def engine(self):
+        return self.member('engine')
+
+    @property
+    def chart_cache(self):
+        return self.member('chart_cache')
+
+    @property
+    def year_range(self):
+        # Full year range, the default of the year slider
+        years = self.store['year']
+        return (int(years.min()), int(years.max()))
+
+    def extended(self, version, df, removed_labels):
+        # Next version with the preprocessed rows of df added and the rows labelled removed dropped.
+        # Indexes built for this version are carried over incrementally, the rest stay lazy.
+        start = len(self.store)
+        removed = self.store.positions(removed_labels)
+        store, artist_remap = self.store.extended(df, removed)
+        dataset = Dataset(version, store)
+
+        built = dict(self.built)
+        if 'genre_index' in built or 'cube' in built:
+            built['genre_index'] = self.genre_index.updated(store, removed, start)
+            dataset.built['genre_index'] = built['genre_index']
+        if 'cube' in built:
+            dataset.built['cube'] = built['cube'].updated(store, built['genre_index'], removed, start, artist_remap)
+        if 'artist_index' in built:
+            dataset.built['artist_index'] = built['artist_index'].updated(store, artist_remap)
+        if 'search_index' in built:
+            dataset.built['search_index'] = built['search_index'].extended(store, start)
+        return dataset
+
+
+class LiveDataset:
+    # Current Dataset of one CSV file
+
+    def __init__(self, path, interval=REFRESH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.state = None
+        self.current = None
+        self.refresh()
+        if interval > 0:
+            threading.Thread(target=self.watch, name="dataset-watch", daemon=True).start()
+
+    def get(self):
+        if self.interval <= 0:
+            self.refresh()
+        return self.current
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("refresh of %s failed", self.path)
+
+    def holding(self):
+        # True while the ingest state waits to see whether an unterminated last line is complete
+        return self.state is not None and self.state.held_size is not None
+
+    def load(self, version):
+        if shared_store.SHARED_DIR:
+            # Shared mode maps whole versions published by the loader, no per-process ingest state
+            return Dataset(version, shared_store.load(self.path))
+        if self.interval > 0:
+            self.state = data_loader.open_state(self.path)
+            return Dataset(version, SongStore(self.state.songs()))
+        return Dataset(version, SongStore(data_loader.load_songs(self.path)))
+
+    def refresh(self):
+        # Publish a new version if the file changed; returns whether it did
+        fingerprint = data_loader.file_fingerprint(self.path)
+        if fingerprint == self.fingerprint and not self.holding():
+            return False
+        with self.lock:
+            if fingerprint == self.fingerprint and not self.holding():
+                return False
+            started = time.perf_counter()
+            if self.state is not None and self.state.resume(self.path):
+                removed, added = self.state.changes(self.path)
+                dataset = self.current
+                if added is not None:
+                    # A version read up to a held-back last line is keyed by where the read stopped,
+                    # so the version that later adds that line does not reuse its key
+                    version = fingerprint[:2] + (self.state.offset,) if self.holding() else fingerprint
+                    dataset = self.current.extended(version, added, removed)
+                mode, rows = 'append', 0 if added is None else len(added)
+            else:
+                self.state = None
+                dataset = self.load(fingerprint)
+                mode, rows = 'full', len(dataset.store)
+
+            self.current = dataset
+            self.fingerprint = fingerprint
+            logger.info("%s refresh of %s: %d rows in %.3f s", mode, self.path, rows, time.perf_counter() - started)
+
+            if mode == 'append' and rows:
+                # Persist the ingest state after publishing, so a restart does not re-read the delta
+                try:
+                    self.state.save(data_loader.snapshot_path(self.path))
+                except OSError:
+                    pass
+                except Exception:
+                    # The new version is already live, a snapshot that cannot be written must not undo that
+                    logger.exception("snapshot of %s failed", self.path)
+        return True
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    # Small thread-safe LRU map, shared by every session of the app. With weigh/max_weight the
+    # total weight of the entries (e.g. their size in bytes) is bounded too
+
+    def __init__(self, maxsize=128, max_weight=None, weigh=None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._weights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        weight = self.weigh(value) if self.weigh else 0
+        with self._lock:
+            self.weight += weight - self._weights.get(key, 0)
+            self._items[key] = value
+            self._weights[key] = weight
+            self._items.move_to_end(key)
+            while len(self._items) > 1 and (
+                len(self._items) > self.maxsize
+                or (self.max_weight is not None and self.weight > self.max_weight)
+            ):
+                old_key, _ = self._items.popitem(last=False)
+                self.weight -= self._weights.pop(old_key)
+
+    def weight_of(self, key):
+        return self._weights.get(key, 0)
+
+    def get_or_create(self, key, factory):
+        # Build the value outside the lock; two sessions racing on the same key just build it twice
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._weights.clear()
+            self.weight = 0
+
+
+_MISSING = object()
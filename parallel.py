@@ -0,0 +1,72 @@
+# Parallel aggregation: work split into blocks of rows (or years, or genre sets) whose partial
+# results are merged by the caller, on a shared thread pool when more than one worker is set.
+#
+# Aggregation is serial by default. Threads only pay off when the NumPy kernels of the blocks
+# (bincount, sort, sums, matmul, fancy indexing) run outside the GIL long enough to overlap, which
+# depends on the kernel and the machine: compare the build_cube_workers_* and
+# home_aggregates_workers_* phases of benchmarks/run_benchmarks.py at 1, 2 and 4 workers before
+# raising SPOTIFY_AGGREGATE_WORKERS. Work smaller than MIN_BLOCK_ROWS per block is never split,
+# since the pool overhead would outweigh it.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+AGGREGATE_WORKERS = int(os.environ.get("SPOTIFY_AGGREGATE_WORKERS", "1"))
+
+# Smallest block worth handing to another thread
+MIN_BLOCK_ROWS = 200_000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=AGGREGATE_WORKERS, thread_name_prefix='aggregate')
+        return _pool
+
+
+def set_workers(workers):
+    # Change the thread count; the pool is started again at its new size when next needed
+    global AGGREGATE_WORKERS, _pool
+    with _pool_lock:
+        AGGREGATE_WORKERS = workers
+        old, _pool = _pool, None
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def n_blocks(n_rows, min_rows=MIN_BLOCK_ROWS, workers=None):
+    workers = AGGREGATE_WORKERS if workers is None else workers
+    return max(1, min(workers, n_rows // max(min_rows, 1)))
+
+
+def blocks(n_rows, min_rows=MIN_BLOCK_ROWS, workers=None):
+    # Contiguous slices covering range(n_rows), one per worker when there is enough work
+    count = n_blocks(n_rows, min_rows, workers)
+    bounds = [n_rows * i // count for i in range(count + 1)]
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def balanced(weights, count):
+    # Split positions 0..len(weights) into at most count contiguous groups of similar total weight,
+    # e.g. years by their number of songs
+    total = sum(weights)
+    bounds, running = [0], 0
+    for position, weight in enumerate(weights):
+        running += weight
+        if len(bounds) < count and running >= total * len(bounds) / count and position + 1 < len(weights):
+            bounds.append(position + 1)
+    bounds.append(len(weights))
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def map_blocks(fn, items):
+    # [fn(item) for item in items], on the pool when there is more than one item. Calls made
+    # from a pool thread run serially, so nested blocks never wait on each other for a thread
+    items = list(items)
+    if len(items) <= 1 or threading.current_thread().name.startswith('aggregate'):
+        return [fn(item) for item in items]
+    return list(pool().map(fn, items))
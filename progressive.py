@@ -0,0 +1,85 @@
+# Time-budgeted progressive rendering
+#
+# Some charts cost more the bigger the catalogue: the danceability boxplot over many genre sets,
+# the top artists of a genre selection, the profile of an artist with thousands of songs. Their
+# exact data is computed on a small background pool, and a rerun waits for it only until its
+# render budget is spent. Whatever is not ready by then is drawn from a uniform sample of the
+# rows instead, and the page reruns once the exact results are in; they land in the chart and
+# profile caches, so that rerun is quick. A rerun therefore never blocks on them for longer
+# than the budget, whatever the size of the data.
+#
+# SPOTIFY_RENDER_BUDGET is the budget in seconds per rerun; 0 always waits for the exact results.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import chart_data
+from lru_cache import LRUCache
+
+RENDER_BUDGET = float(os.environ.get("SPOTIFY_RENDER_BUDGET", "0.5"))
+
+# Threads computing exact results in the background
+REFINE_WORKERS = int(os.environ.get("SPOTIFY_REFINE_WORKERS", "2"))
+
+# Rows behind a sampled first render, and songs behind a sampled artist profile: no more than its
+# loudness scatter draws, so the sample needs no thinning
+SAMPLE_ROWS = 20_000
+ARTIST_SAMPLE_ROWS = chart_data.MAX_POINT_ROWS
+
+# Seconds between checks for finished refinements
+POLL_SECONDS = 0.5
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Futures of the refinements by key, running or recently finished, so the rerun that follows a
+# refinement gets its result at once instead of waiting on the pool again
+refinements = LRUCache(maxsize=256)
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=REFINE_WORKERS, thread_name_prefix='refine')
+        return _pool
+
+
+def refine(key, exact):
+    # Future of exact(), started once per key; one that failed is started again. Two sessions
+    # asking at the same moment may both start it, like a cache miss in LRUCache
+    future = refinements.get(key)
+    if future is None or (future.done() and future.exception() is not None):
+        future = pool().submit(exact)
+        refinements.put(key, future)
+    return future
+
+
+class Budget:
+    # Render budget of one rerun, shared by everything on the page that can be drawn progressively
+
+    def __init__(self, seconds=RENDER_BUDGET):
+        self.seconds = seconds
+        self.deadline = time.perf_counter() + seconds
+        # Refinements this rerun drew a sample for instead
+        self.pending = []
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def result(self, key, exact, sample):
+        # (exact(), True) when it is ready within the budget, else (sample(), False) while exact()
+        # carries on in the background. Errors of exact() are raised here like without a budget
+        if self.seconds <= 0:
+            return exact(), True
+        future = refine(key, exact)
+        try:
+            return future.result(timeout=self.remaining()), True
+        except TimeoutError:
+            self.pending.append(future)
+            return sample(), False
+
+    def refined(self):
+        # True once every refinement this rerun is waiting for has finished
+        return all(future.done() for future in self.pending)
@@ -0,0 +1,289 @@
+# Optional HTTP/JSON API over the query engine, for other tools and load tests
+#
+#   python query_api.py --port 8502
+#
+# It loads the same CSV as the dashboard (SPOTIFY_DATASET) with the same warm-up and refresh.
+# All endpoints are GET. Filters are the query parameters year_from, year_to and genre
+# (repeatable); omitted ones mean the full year range / all genres.
+#
+#   /health                             ready flag and dataset version
+#   /home                               KPIs and the data behind the home charts
+#   /songs?offset=&limit=               one page of the filtered songs
+#   /search?q=&offset=&limit=           song search, most popular first
+#   /artists?q=                         artist lookup
+#   /artist?name=                       profile of one artist
+#   /similar?row=&k=                    nearest songs by audio features
+#   /export?format=csv|parquet|jsonl    the whole filtered table, streamed in chunks
+#
+# Requests run on a thread pool; JSON responses are cached per dataset version and query.
+# For more throughput run several processes on different ports, with SPOTIFY_SHARED_DIR set
+# so they map one copy of the song store.
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+import data_loader
+import exports
+from lru_cache import LRUCache
+from warmup import Warmup
+
+# Threads running queries; numpy and pandas release the GIL for most of the heavy work
+API_WORKERS = int(os.environ.get("SPOTIFY_API_WORKERS", str(os.cpu_count() or 4)))
+
+# Rows per page when limit is not given, and the most a request can ask for
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+logger = logging.getLogger("dashboard.api")
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def records(frame):
+    # JSON-ready rows of a DataFrame, with NaN as null
+    return json.loads(frame.to_json(orient='records'))
+
+
+def integer(params, name, default=None, low=None, high=None):
+    if name not in params:
+        if default is None:
+            raise BadRequest(f"missing parameter {name}")
+        return default
+    try:
+        value = int(params[name][-1])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise BadRequest(f"{name} out of range")
+    return value
+
+
+def text(params, name):
+    if not params.get(name) or not params[name][-1]:
+        raise BadRequest(f"missing parameter {name}")
+    return params[name][-1]
+
+
+def filters(params):
+    # (year_range, genres) of the request, as QueryEngine takes them
+    year_range = tuple(integer(params, name) if name in params else None for name in ('year_from', 'year_to'))
+    return year_range, params.get('genre')
+
+
+def song_page(engine, rows, params):
+    offset = integer(params, 'offset', 0, low=0)
+    limit = integer(params, 'limit', DEFAULT_LIMIT, low=1, high=MAX_LIMIT)
+    page = rows[offset:offset + limit]
+    songs = engine.rows(page)
+    songs.insert(0, 'row', page)
+    return {'total': len(rows), 'offset': offset, 'songs': records(songs.reset_index(drop=True))}
+
+
+def health(engine, params):
+    return {'ready': True, 'version': list(engine.version), 'songs': int(engine.dataset.store.live.sum())}
+
+
+def home(engine, params):
+    view = engine.home(*filters(params))
+    limit = integer(params, 'limit', 10, low=1, high=MAX_LIMIT)
+    artists = view.artist_counts().sort_values('song_count', ascending=False, kind='stable').head(limit)
+    return {
+        'total_songs': view.total_songs,
+        'total_artists': view.total_artists,
+        'total_genres': view.total_genres,
+        'explicit': view.explicit_count,
+        'non_explicit': view.non_explicit_count,
+        'genre_counts': records(view.genre_counts()),
+        'genre_popularity': records(view.genre_popularity_sums()),
+        'top_artists': records(artists),
+        'annual_trends': records(view.annual_trends()),
+        'danceability': records(view.danceability_summaries()),
+    }
+
+
+def songs(engine, params):
+    return song_page(engine, engine.filtered(*filters(params)).rows, params)
+
+
+def search(engine, params):
+    return song_page(engine, engine.search(text(params, 'q'), *filters(params)), params)
+
+
+def artists(engine, params):
+    return {'artists': engine.artists(text(params, 'q'), *filters(params))}
+
+
+def artist(engine, params):
+    profile = engine.artist_profile(text(params, 'name'), *filters(params))
+    return {name: records(value) if isinstance(value, pd.DataFrame) else value for name, value in vars(profile).items()}
+
+
+def similar(engine, params):
+    row = integer(params, 'row', low=0, high=len(engine.dataset.store) - 1)
+    rows, distances = engine.similar(row, *filters(params), k=integer(params, 'k', 5, low=1, high=100))
+    songs = engine.rows(rows)
+    songs.insert(0, 'row', rows)
+    songs.insert(1, 'distance', distances)
+    return {'songs': records(songs.reset_index(drop=True))}
+
+
+ROUTES = {
+    '/health': health,
+    '/home': home,
+    '/songs': songs,
+    '/search': search,
+    '/artists': artists,
+    '/artist': artist,
+    '/similar': similar,
+}
+
+
+class QueryServer:
+    # Minimal asyncio HTTP/1.1 server (keep-alive, GET/HEAD) in front of the query engine
+
+    def __init__(self, path, workers=API_WORKERS):
+        self.warmup = Warmup(path)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        # Encoded JSON bodies keyed by (dataset version, path, query)
+        self.cache = LRUCache(maxsize=4096, max_weight=64 << 20, weigh=len)
+
+    def engine(self):
+        # None until the warm-up is done; get() also picks up a changed CSV
+        if not self.warmup.ready.is_set() or self.warmup.live is None:
+            return None
+        return self.warmup.live.get().engine
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, method, target, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, target, keep_alive):
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        loop = asyncio.get_running_loop()
+        if method not in ('GET', 'HEAD'):
+            return await self.send(writer, 405, {'error': 'method not allowed'}, keep_alive)
+        if url.path != '/export' and url.path not in ROUTES:
+            return await self.send(writer, 404, {'error': 'not found'}, keep_alive)
+
+        engine = await loop.run_in_executor(self.pool, self.engine)
+        if engine is None:
+            if self.warmup.error is not None:
+                return await self.send(writer, 500, {'error': str(self.warmup.error)}, keep_alive)
+            if url.path == '/health':
+                return await self.send(writer, 200, {'ready': False}, keep_alive)
+            return await self.send(writer, 503, {'error': 'warming up'}, keep_alive)
+
+        if url.path == '/export':
+            return await self.export(writer, engine, params, method, keep_alive)
+
+        key = (engine.version, url.path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        body = self.cache.get(key)
+        if body is None:
+            try:
+                result = await loop.run_in_executor(self.pool, ROUTES[url.path], engine, params)
+            except BadRequest as error:
+                return await self.send(writer, 400, {'error': str(error)}, keep_alive)
+            except Exception:
+                logger.exception("%s failed", target)
+                return await self.send(writer, 500, {'error': 'internal error'}, keep_alive)
+            body = json.dumps(result).encode('utf-8')
+            self.cache.put(key, body)
+        await self.send(writer, 200, body, keep_alive, head=method == 'HEAD')
+
+    async def send(self, writer, status, body, keep_alive, content_type='application/json', head=False):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        writer.write(self.header(status, keep_alive, content_type, f"Content-Length: {len(body)}"))
+        if not head:
+            writer.write(body)
+        await writer.drain()
+
+    async def export(self, writer, engine, params, method, keep_alive):
+        # Chunked transfer encoding: each chunk of the export is produced on the pool and sent
+        # before the next one is built, so a slow client holds back the export, not memory
+        labels = {extension: label for label, (extension, _) in exports.FORMATS.items()}
+        extension = params.get('format', ['csv'])[-1]
+        if extension not in labels:
+            return await self.send(writer, 400, {'error': 'format must be csv, parquet or jsonl'}, keep_alive)
+        try:
+            view = engine.filtered(*filters(params))
+        except BadRequest as error:
+            return await self.send(writer, 400, {'error': str(error)}, keep_alive)
+
+        _, mime = exports.FORMATS[labels[extension]]
+        disposition = f'Content-Disposition: attachment; filename="songs.{extension}"'
+        writer.write(self.header(200, keep_alive, mime, 'Transfer-Encoding: chunked', disposition))
+        if method == 'HEAD':
+            return await writer.drain()
+        loop = asyncio.get_running_loop()
+        chunks = exports.stream(view, extension)
+        while True:
+            data = await loop.run_in_executor(self.pool, next, chunks, None)
+            if data is None:
+                break
+            if data:
+                writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    @staticmethod
+    def header(status, keep_alive, content_type, *extra):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                   500: 'Internal Server Error', 503: 'Service Unavailable'}
+        lines = [f"HTTP/1.1 {status} {reasons[status]}", f"Content-Type: {content_type}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}", *extra]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info("query API on http://%s:%d", host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON API over the dashboard's queries")
+    parser.add_argument('--csv', default=data_loader.DATASET_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--workers', type=int, default=API_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(QueryServer(args.csv, args.workers).serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import numpy as np
+
+from aggregates import SampleRollup
+from artist_index import ArtistProfile
+from lru_cache import LRUCache
+
+
+def sample_rows(rows, n):
+    # Uniform sample of n of the sorted row positions, the same one every time
+    if len(rows) <= n:
+        return rows
+    return rows[np.sort(np.random.default_rng(0).choice(len(rows), n, replace=False))]
+
+
+class QueryEngine:
+    # The dashboard's queries over one Dataset version (see live_dataset.py), shared by the
+    # Streamlit page and the HTTP API (query_api.py). A filter is a year range plus a genre
+    # selection, None standing for the full range / all genres. Filter masks and artist
+    # profiles are cached per filter state.
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.masks = LRUCache(maxsize=8)
+        # Artist profiles keyed by (artist, year range, genre selection)
+        self.profiles = LRUCache(maxsize=256)
+
+    @property
+    def version(self):
+        return self.dataset.version
+
+    def resolve(self, year_range=None, genres=None):
+        full_range = self.dataset.year_range
+        if year_range is None:
+            year_range = full_range
+        year_range = tuple(full_range[i] if year is None else int(year) for i, year in enumerate(year_range))
+        if genres is None:
+            genres = self.dataset.genre_index.genres
+        return year_range, genres
+
+    def filter_state(self, year_range=None, genres=None):
+        # Hashable key of a filter, the same for every way of spelling it
+        year_range, genres = self.resolve(year_range, genres)
+        return year_range, self.dataset.genre_index.selection_key(genres)
+
+    def mask(self, year_range=None, genres=None):
+        # Rows matching the filter, as a boolean mask over the store
+        year_range, genres = self.resolve(year_range, genres)
+        return self.masks.get_or_create(
+            self.filter_state(year_range, genres),
+            lambda: self.dataset.genre_index.filter_mask(self.dataset.store['year'], year_range, genres)
+        )
+
+    def filtered(self, year_range=None, genres=None):
+        return self.dataset.store.view(self.mask(year_range, genres))
+
+    def rows(self, positions):
+        # DataFrame of the given row positions
+        return self.dataset.store.frame(positions)
+
+    def search(self, term, year_range=None, genres=None):
+        # Row positions of the matching songs, most popular first
+        return self.dataset.search_index.search(term, mask=self.mask(year_range, genres))
+
+    def artists(self, term, year_range=None, genres=None):
+        return self.dataset.artist_index.lookup(term, mask=self.mask(year_range, genres))
+
+    def artist_profile(self, artist, year_range=None, genres=None, sample=None):
+        # With sample, a profile estimated from at most that many of the artist's songs
+        mask = self.mask(year_range, genres)
+        artist_index = self.dataset.artist_index
+
+        def build():
+            rows = artist_index.artist_rows(artist, mask)
+            if sample is None:
+                return ArtistProfile(artist, self.dataset.store.frame(rows))
+            return ArtistProfile(artist, self.dataset.store.frame(sample_rows(rows, sample)), song_count=len(rows))
+
+        return self.profiles.get_or_create((artist,) + self.filter_state(year_range, genres) + (sample,), build)
+
+    def home(self, year_range=None, genres=None):
+        # Rollup of the cube that every home chart reads
+        year_range, genres = self.resolve(year_range, genres)
+        return self.dataset.cube.rollup(year_range, genres)
+
+    def home_sample(self, year_range=None, genres=None, sample=None):
+        # Estimate of the home rollup from a uniform sample of at most sample filtered rows
+        rows = np.flatnonzero(self.mask(year_range, genres))
+        return SampleRollup(self.dataset.store, sample_rows(rows, sample or len(rows)), len(rows))
+
+    def similar(self, row, year_range=None, genres=None, k=5):
+        # Row positions and distances of the k songs nearest to row within the filter
+        return self.dataset.similar_songs.nearest(row, k=k, mask=self.mask(year_range, genres))
@@ -0,0 +1,40 @@
+# Session state key prefix for the "Show More" toggles of the Search Songs cards
+DETAIL_PREFIX = 'show_detail_'
+
+PAGE_SIZES = (10, 20, 50)
+
+# Rows per page of the About table
+TABLE_PAGE_SIZES = (50, 100, 500)
+
+
+def detail_key(idx):
+    return f"{DETAIL_PREFIX}{idx}"
+
+
+def page_count(total, page_size):
+    return max(1, -(-total // page_size))
+
+
+def page_bounds(total, page, page_size):
+    # Clamp the page number and return it with the [start, stop) slice of the hits it covers
+    page = min(max(1, page), page_count(total, page_size))
+    start = (page - 1) * page_size
+    return page, start, min(start + page_size, total)
+
+
+def turn_page(state, key, step, n_pages):
+    # on_click callback of the Previous / Next buttons: runs before the rerun that draws them again
+    state[key] = min(max(1, state[key] + step), n_pages)
+
+
+def evict_stale_details(state, visible_keys=()):
+    # Drop detail toggles of cards that are no longer on screen so session state stays bounded
+    visible_keys = set(visible_keys)
+    stale = [
+        key for key in list(state.keys())
+        if isinstance(key, str) and key.startswith(DETAIL_PREFIX)
+        and not key.endswith('_button') and key not in visible_keys
+    ]
+    for key in stale:
+        del state[key]
+    return len(stale)
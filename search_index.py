@@ -0,0 +1,189 @@
+import copy
+import unicodedata
+
+import numpy as np
+
+# Marks the start and end of every field so 1 and 2 character terms still fall inside a trigram,
+# and trigrams never span two fields
+PAD = '\x00'
+
+
+def normalize(text):
+    # Casefold and strip accents, so "Beyoncé" matches "beyonce"
+    text = str(text)
+    if text.isascii():
+        return text.lower().replace(PAD, '')
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).replace(PAD, '')
+
+
+def trigram_keys(codepoints):
+    # Pack three 21-bit code points into one 64-bit key
+    cp = codepoints.astype(np.uint64)
+    return (cp[:-2] << np.uint64(42)) | (cp[1:-1] << np.uint64(21)) | cp[2:]
+
+
+def to_codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+
+
+def padded(fields):
+    # Normalized fields of one row, each wrapped in PAD
+    return PAD + (PAD + PAD).join(fields) + PAD
+
+
+# A refresh adds a segment per batch of new rows; past this many they are merged into one
+MAX_SEGMENTS = 8
+
+
+class Segment:
+    # Sorted trigram keys with the posting list (row ids) of each key
+
+    def __init__(self, keys, offsets, postings):
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+
+    @classmethod
+    def build(cls, texts, ids):
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        codepoints = to_codepoints(''.join(texts))
+        row_of_char = np.repeat(np.arange(len(texts), dtype=np.int32), lengths)
+
+        # Keep only trigrams that start and end inside the same row
+        keys = trigram_keys(codepoints)
+        same_row = row_of_char[:-2] == row_of_char[2:]
+        keys, rows = keys[same_row], row_of_char[:-2][same_row]
+
+        # Rows are already ascending, so a stable sort by key gives sorted posting lists per key
+        order = np.argsort(keys, kind='stable')
+        keys, rows = keys[order], rows[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])
+        keys, rows = keys[first], rows[first]
+        return cls.from_pairs(keys, np.asarray(ids)[rows] if len(rows) else rows)
+
+    @classmethod
+    def from_pairs(cls, keys, postings):
+        # keys sorted, one entry per (key, row id)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+        return cls(keys[starts], np.append(starts, len(keys)), postings)
+
+    @classmethod
+    def merge(cls, segments):
+        keys = np.concatenate([np.repeat(s.keys, np.diff(s.offsets)) for s in segments])
+        postings = np.concatenate([s.postings for s in segments])
+        order = np.lexsort((postings, keys))
+        return cls.from_pairs(keys[order], postings[order])
+
+    def remapped(self, remap):
+        return Segment(self.keys, self.offsets, remap[self.postings])
+
+    def posting(self, key):
+        pos = np.searchsorted(self.keys, key)
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return self.postings[:0]
+        return self.postings[self.offsets[pos]:self.offsets[pos + 1]]
+
+    def containing(self, codepoints):
+        # Posting lists of every trigram that contains the 1 or 2 code points
+        chars = [(self.keys >> np.uint64(shift)) & np.uint64(0x1FFFFF) for shift in (42, 21, 0)]
+        hit = np.zeros(len(self.keys), dtype=bool)
+        for start in range(3 - len(codepoints) + 1):
+            match = np.ones(len(self.keys), dtype=bool)
+            for i, c in enumerate(codepoints):
+                match &= chars[start + i] == c
+            hit |= match
+        return [self.postings[self.offsets[k]:self.offsets[k + 1]] for k in np.flatnonzero(hit)]
+
+
+class TrigramIndex:
+    # Trigram inverted index over padded, normalized row texts; rank orders the results (highest first)
+
+    def __init__(self, texts, rank):
+        self.texts = texts
+        self.rank = np.asarray(rank)
+        self.segments = [Segment.build(texts, np.arange(len(texts)))]
+
+    def updated(self, texts, rank, new_ids, remap=None):
+        # Index over a new list of texts that only tokenizes the texts of new_ids;
+        # remap maps the ids of this index to the new ones when they moved
+        index = copy.copy(self)
+        index.texts = texts
+        index.rank = np.asarray(rank)
+        segments = self.segments if remap is None else [s.remapped(remap) for s in self.segments]
+        segments = segments + [Segment.build([texts[i] for i in new_ids], new_ids)]
+        index.segments = [Segment.merge(segments)] if len(segments) > MAX_SEGMENTS else segments
+        return index
+
+    def posting(self, key):
+        lists = [s.posting(key) for s in self.segments]
+        return lists[0] if len(lists) == 1 else np.concatenate(lists)
+
+    def candidates(self, term):
+        if len(term) >= 3:
+            # Rows containing every trigram of the term, shortest posting list first
+            lists = sorted((self.posting(k) for k in np.unique(trigram_keys(to_codepoints(term)))), key=len)
+            result = lists[0]
+            for posting in lists[1:]:
+                if not len(result):
+                    break
+                result = np.intersect1d(result, posting, assume_unique=True)
+            return result, True
+
+        # Short terms: union the posting lists of every indexed trigram that contains the term
+        cp = to_codepoints(term).astype(np.uint64)
+        lists = [posting for s in self.segments for posting in s.containing(cp)]
+        if not lists:
+            return np.zeros(0, dtype=np.int64), False
+        return np.unique(np.concatenate(lists)), False
+
+    def search(self, term, mask=None):
+        # Row positions matching the term, best ranked first; mask restricts to filtered rows
+        term = normalize(term)
+        if not term:
+            return np.zeros(0, dtype=np.int64)
+
+        rows, needs_check = self.candidates(term)
+        if mask is not None:
+            rows = rows[mask[rows]]
+        if needs_check and len(term) > 3:
+            # Trigram hits can be false positives, confirm the substring on the candidates only
+            rows = np.array([r for r in rows if term in self.texts[r]], dtype=np.int64)
+
+        rows = rows.astype(np.int64)
+        return rows[np.lexsort((rows, -self.rank[rows]))]
+
+
+class SearchIndex(TrigramIndex):
+    # Song search over artist, title and genre tokens, most popular songs first
+
+    def __init__(self, artists, songs, genre_lists, popularity):
+        super().__init__(self.row_texts(artists, songs, genre_lists), popularity)
+
+    @staticmethod
+    def row_texts(artists, songs, genre_lists):
+        # Artists and genres repeat a lot, normalize each distinct value once
+        seen = {}
+
+        def norm(field):
+            value = seen.get(field)
+            if value is None:
+                value = seen[field] = normalize(field)
+            return value
+
+        return [
+            padded([norm(artist), normalize(song), *map(norm, genres)])
+            for artist, song, genres in zip(artists, songs, genre_lists)
+        ]
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store['artist'].tolist(), store['song'].tolist(), store.genre_lists(), store['popularity'])
+
+    def extended(self, store, start):
+        # Index of a store extended from this one: rows from start on are new
+        rows = np.arange(start, len(store))
+        texts = self.row_texts(store.artists[store.artist_codes[rows]].tolist(), store.titles(rows).tolist(),
+                               store.genre_lists(rows))
+        return self.updated(self.texts + texts, store['popularity'], rows)
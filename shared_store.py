@@ -0,0 +1,141 @@
+# Song store shared by every Streamlit worker on a host through memory-mapped .npy files
+#
+#   SPOTIFY_SHARED_DIR=/dev/shm/spotify streamlit run tubes_uas_streamlit.py
+#   python shared_store.py            # optional: publish from a loader process before the workers start
+#
+# Each dataset version is a directory of .npy columns. CURRENT names the published version
+# and is swapped atomically, so workers that attach see either the old or the new version,
+# never a half-written one. Workers map the files read-only: the page cache holds one copy
+# of the columns no matter how many processes use them. One directory serves one dataset.
+import argparse
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+import data_loader
+from song_store import SongStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, concurrent builds just duplicate work
+    fcntl = None
+
+# Shared mode is off unless this is set; /dev/shm keeps the files in memory on Linux
+SHARED_DIR = os.environ.get("SPOTIFY_SHARED_DIR")
+
+# Bump this whenever the layout of SongStore.arrays() changes
+FORMAT_VERSION = 2
+
+CURRENT = 'CURRENT'
+
+
+def version_name(path, content_hash):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{content_hash[:16]}-s{data_loader.SNAPSHOT_VERSION}-f{FORMAT_VERSION}"
+
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_current(root, version, fingerprint):
+    tmp = os.path.join(root, f"{CURRENT}.{os.getpid()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump({'version': version, 'fingerprint': list(fingerprint)}, f)
+    os.replace(tmp, os.path.join(root, CURRENT))
+
+
+@contextmanager
+def build_lock(root):
+    # Only one process builds a version, the others wait and then attach to it
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'build.lock'), 'w') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish(store, root, version):
+    # Write every column to a temporary directory, then rename it into place
+    target = os.path.join(root, version)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in store.arrays().items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(values), allow_pickle=False)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'columns': store.columns, 'rows': len(store)}, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.rename(tmp, target)
+
+
+def attach(root, version):
+    # Read-only views of the published columns; nothing is copied into this process
+    directory = os.path.join(root, version)
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in os.listdir(directory):
+        if name.endswith('.npy'):
+            path = os.path.join(directory, name)
+            try:
+                arrays[name[:-4]] = np.load(path, mmap_mode='r', allow_pickle=False)
+            except ValueError:
+                # Empty arrays cannot be mapped
+                arrays[name[:-4]] = np.load(path, allow_pickle=False)
+    return SongStore.from_arrays(meta['columns'], arrays)
+
+
+def remove_old_versions(root, keep):
+    # Processes still mapping a removed version keep reading it until they swap
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load(path, root=None):
+    # Attach to the published version of this CSV, building and publishing it first if needed
+    root = root or SHARED_DIR
+    fingerprint = list(data_loader.file_fingerprint(path))
+    current = read_current(root)
+    if current and current['fingerprint'] == fingerprint:
+        return attach(root, current['version'])
+
+    with build_lock(root):
+        # Another worker may have published while this one waited for the lock
+        current = read_current(root)
+        if current and current['fingerprint'] == fingerprint:
+            return attach(root, current['version'])
+
+        version = version_name(path, data_loader.file_hash(path))
+        if not os.path.exists(os.path.join(root, version, 'meta.json')):
+            publish(SongStore(data_loader.load_songs(path)), root, version)
+        write_current(root, version, fingerprint)
+        remove_old_versions(root, keep={version, current and current['version']})
+    return attach(root, version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the song store for shared-memory workers")
+    parser.add_argument('--csv', default=data_loader.DATASET_PATH)
+    parser.add_argument('--dir', default=SHARED_DIR, required=SHARED_DIR is None)
+    args = parser.parse_args()
+
+    store = load(args.csv, args.dir)
+    print(f"{read_current(args.dir)['version']}: {len(store)} songs in {args.dir}")
+
+
+if __name__ == '__main__':
+    main()
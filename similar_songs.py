@@ -0,0 +1,73 @@
+import numpy as np
+
+from song_store import FLOAT_COLUMNS
+
+# Audio features compared, each standardized to mean 0 / std 1 so none dominates the distance
+FEATURES = FLOAT_COLUMNS
+
+# Rows scored per block, bounding the temporaries of a query to a few MB at any table size
+BLOCK_ROWS = 1 << 18
+
+# Stride of the sample that sets the candidate threshold in smallest()
+SAMPLE_STRIDE = 64
+
+
+def smallest(values, k, mask=None):
+    # Positions of the k smallest values (among those in mask, if given), in no particular order.
+    # The k-th smallest of a strided sample bounds them from above, which leaves a few hundred
+    # candidates to partition; the mask is only looked up for the sample and the candidates
+    sample = np.arange(0, len(values), SAMPLE_STRIDE)
+    if mask is not None:
+        sample = sample[mask[sample]]
+    if len(sample) >= k:
+        threshold = np.partition(values[sample], k - 1)[k - 1]
+        candidates = np.flatnonzero(values <= threshold)
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+    else:
+        candidates = np.arange(len(values)) if mask is None else np.flatnonzero(mask)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(values[candidates], k)[:k]]
+    return candidates
+
+
+class SimilarSongs:
+    # Exact k-nearest-neighbour search (Euclidean, over standardized audio features): blocked
+    # vector-matrix products over a float32 matrix built once per dataset version
+
+    def __init__(self, store):
+        features = np.vstack([store[column].astype(np.float64) for column in FEATURES])
+        live = store.live
+        mean = features[:, live].mean(axis=1, keepdims=True) if live.any() else 0
+        std = features[:, live].std(axis=1, keepdims=True) if live.any() else np.ones((len(FEATURES), 1))
+        std[~(std > 0)] = 1
+        # Feature-major, so each block is a contiguous slice of every feature row
+        self.vectors = ((features - mean) / std).astype(np.float32)
+        # Unknown features are treated as average rather than excluding the song
+        self.vectors[np.isnan(self.vectors)] = 0
+        self.norms = np.einsum('ij,ij->j', self.vectors, self.vectors)
+        # Dead rows never come back from a query
+        self.norms[~live] = np.inf
+
+    def nearest(self, row, k=5, mask=None):
+        # Row positions of the k songs closest to row (itself excluded), nearest first,
+        # with their distances. mask restricts the candidates, e.g. to the current filters
+        query = self.vectors[:, row]
+        n_rows = self.vectors.shape[1]
+        best_rows, best_dist = [], []
+        for start in range(0, n_rows, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, n_rows)
+            # |a - b|^2 = |a|^2 - 2 a.b + |b|^2; |b|^2 is the same for every candidate and left out
+            dist = self.norms[start:stop] - 2 * (query @ self.vectors[:, start:stop])
+            if start <= row < stop:
+                dist[row - start] = np.inf
+            top = smallest(dist, k, None if mask is None else mask[start:stop])
+            best_rows.append(top + start)
+            best_dist.append(dist[top])
+
+        rows, dist = np.concatenate(best_rows), np.concatenate(best_dist)
+        order = np.lexsort((rows, dist))[:k]
+        rows, dist = rows[order], dist[order]
+        found = np.isfinite(dist)
+        dist = np.sqrt(np.maximum(dist[found] + self.norms[row], 0))
+        return rows[found], dist
@@ -0,0 +1,277 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Audio features are reported with at most 6 significant digits, float32 holds them
+FLOAT_COLUMNS = ('danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness',
+                 'liveness', 'valence', 'tempo')
+
+# Smallest dtypes that hold the values of songs_normalize.csv
+COMPACT_DTYPES = {
+    'duration_ms': np.int32,
+    'explicit': np.bool_,
+    'year': np.int16,
+    'popularity': np.int16,
+    'key': np.int8,
+    'mode': np.int8,
+    **{column: np.float32 for column in FLOAT_COLUMNS},
+}
+
+
+def code_dtype(n):
+    # Smallest signed integer type for codes 0..n-1
+    for dtype in (np.int8, np.int16, np.int32):
+        if n <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def interned(values):
+    return np.array([sys.intern(str(value)) for value in values], dtype=object)
+
+
+def pack(values):
+    # Strings as one UTF-8 buffer plus offsets, for columns that rarely repeat
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def unpack(buffer, offsets, rows):
+    data = buffer.data
+    rows = np.asarray(rows, dtype=np.int64)
+    bounds = zip(offsets[rows].tolist(), offsets[rows + 1].tolist())
+    return np.array([str(data[start:stop], 'utf-8') for start, stop in bounds], dtype=object)
+
+
+def explode_genres(genre_lists):
+    # Genre names of every row in one flat list, plus CSR offsets into it
+    exploded = pd.Series(genre_lists.to_numpy()).explode()
+    valid = exploded.notna().to_numpy()
+    offsets = np.searchsorted(exploded.index.to_numpy()[valid], np.arange(len(genre_lists) + 1))
+    return exploded[valid], offsets
+
+
+def shortest_float64(values):
+    # float64 of the shortest repr of each float32, i.e. float(str(value)). Rounding to 6
+    # significant digits gives exactly that whenever the repr has at most 6 digits: only one
+    # such decimal fits in a float32's rounding interval. Values where the rounded result does
+    # not map back to the same float32, or too large / small for exact powers of ten, take the
+    # slow path.
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        wide = values.astype(np.float64)
+        exponent = np.floor(np.log10(np.abs(wide)))
+        digits = 5 - exponent
+        fast = np.isfinite(digits) & (np.abs(digits) <= 22)
+        scale = 10.0 ** np.where(fast, np.abs(digits), 0)
+        mantissa = np.rint(np.where(digits >= 0, wide * scale, wide / scale))
+        rounded = np.where(digits >= 0, mantissa / scale, mantissa * scale)
+        fast &= rounded.astype(values.dtype) == values
+    out = np.where(fast, rounded, wide)
+    slow = ~fast & (wide != 0)
+    if slow.any():
+        out[slow] = values[slow].astype(str).astype(np.float64)
+    return out
+
+
+def widen(values):
+    # Back to the dtypes pandas read from the CSV. float32 goes through its shortest repr,
+    # so 0.751 comes back as 0.751 and not 0.7509999871253967
+    if values.dtype.kind == 'f' and values.dtype != np.float64:
+        return shortest_float64(values)
+    if values.dtype.kind == 'i':
+        return values.astype(np.int64)
+    return values
+
+
+class SongStore:
+    # Column store of the preprocessed song table: artist codes, CSR genre codes
+    # (offsets + codes), packed titles and downcast numeric columns
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.index = df.index.to_numpy()
+
+        codes, artists = pd.factorize(df['artist'], sort=True)
+        self.artists = interned(artists)
+        self.artist_codes = codes.astype(code_dtype(len(self.artists)))
+        # Titles are nearly all distinct, so interning would not share much
+        self.song_bytes, self.song_offsets = pack(df['song'])
+
+        # Genres of row i are genre_codes[genre_offsets[i]:genre_offsets[i + 1]],
+        # coded in order of first appearance like GenreIndex
+        names, self.genre_offsets = explode_genres(df['genre'])
+        codes, genres = pd.factorize(names)
+        self.genres = interned(genres)
+        self.genre_codes = codes.astype(code_dtype(len(self.genres)))
+
+        self.data = {}
+        for column in self.columns:
+            if column in ('artist', 'song', 'genre'):
+                continue
+            if column == 'duration' and 'duration_ms' in df:
+                # Derived from duration_ms when materialized
+                continue
+            self.data[column] = df[column].to_numpy(dtype=COMPACT_DTYPES.get(column))
+
+        # Rows replaced by a later refresh stay in the arrays but are no longer live
+        self.live = np.ones(len(df), dtype=bool)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, column):
+        # Whole column as an array, in its compact dtype
+        if column == 'artist':
+            return self.artists[self.artist_codes]
+        if column == 'song':
+            return self.titles(np.arange(len(self)))
+        if column == 'duration' and column not in self.data:
+            return self.data['duration_ms'] / 60000
+        return self.data[column]
+
+    def titles(self, rows):
+        return unpack(self.song_bytes, self.song_offsets, rows)
+
+    def positions(self, labels):
+        # Positions of the live rows with these index labels
+        return np.flatnonzero(np.isin(self.index, np.asarray(labels)) & self.live)
+
+    def genre_rows(self):
+        # Row position of every entry of genre_codes
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.genre_offsets))
+
+    def genre_lists(self, rows=None):
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        starts = self.genre_offsets[rows]
+        lengths = self.genre_offsets[rows + 1] - starts
+        # Gather the genre names of all rows at once, then cut them into one list per row
+        ends = np.cumsum(lengths)
+        positions = np.repeat(starts - (ends - lengths), lengths) + np.arange(ends[-1] if len(ends) else 0)
+        names = self.genres[self.genre_codes[positions]].tolist()
+        bounds = np.r_[0, ends].tolist()
+        return [names[bounds[i]:bounds[i + 1]] for i in range(len(rows))]
+
+    def frame(self, rows=None):
+        # DataFrame of the given row positions, with the columns and dtypes of the CSV
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        columns = {}
+        for column in self.columns:
+            if column == 'artist':
+                columns[column] = self.artists[self.artist_codes[rows]]
+            elif column == 'song':
+                columns[column] = self.titles(rows)
+            elif column == 'genre':
+                columns[column] = self.genre_lists(rows)
+            elif column == 'duration' and column not in self.data:
+                columns[column] = self.data['duration_ms'][rows] / 60000
+            else:
+                columns[column] = widen(self.data[column][rows])
+        return pd.DataFrame(columns, index=self.index[rows], columns=self.columns)
+
+    def arrays(self):
+        # Everything needed to rebuild the store, as flat arrays (see from_arrays)
+        arrays = {
+            'index': self.index,
+            'artist_codes': self.artist_codes,
+            'song_bytes': self.song_bytes,
+            'song_offsets': self.song_offsets,
+            'genre_codes': self.genre_codes,
+            'genre_offsets': self.genre_offsets,
+            'live': self.live,
+        }
+        arrays['artist_bytes'], arrays['artist_offsets'] = pack(self.artists)
+        arrays['genre_bytes'], arrays['genre_name_offsets'] = pack(self.genres)
+        for column, values in self.data.items():
+            arrays[f'data.{column}'] = values
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, columns, arrays):
+        # Rebuild a store around existing arrays (e.g. memory-mapped files) without copying them
+        store = cls.__new__(cls)
+        store.columns = list(columns)
+        store.index = arrays['index']
+        store.artist_codes = arrays['artist_codes']
+        store.song_bytes, store.song_offsets = arrays['song_bytes'], arrays['song_offsets']
+        store.genre_codes, store.genre_offsets = arrays['genre_codes'], arrays['genre_offsets']
+        store.live = arrays['live']
+        store.artists = interned(unpack(arrays['artist_bytes'], arrays['artist_offsets'],
+                                        np.arange(len(arrays['artist_offsets']) - 1)))
+        store.genres = interned(unpack(arrays['genre_bytes'], arrays['genre_name_offsets'],
+                                       np.arange(len(arrays['genre_name_offsets']) - 1)))
+        store.data = {name[5:]: values for name, values in arrays.items() if name.startswith('data.')}
+        return store
+
+    def extended(self, df, removed):
+        # Next version of the store: the preprocessed rows of df appended and the rows at positions
+        # removed no longer live. Artist codes stay alphabetical, so existing codes can move;
+        # also returns the old -> new artist code mapping.
+        store = SongStore.__new__(SongStore)
+        store.columns = self.columns
+        store.index = np.concatenate([self.index, df.index.to_numpy()])
+
+        artists = df['artist'].to_numpy(dtype=object)
+        names = np.asarray(pd.unique(artists), dtype=object)
+        found = np.searchsorted(self.artists, names)
+        known = (found < len(self.artists)) & (self.artists[np.minimum(found, len(self.artists) - 1)] == names)
+        new_names = np.sort(names[~known])
+        at = np.searchsorted(self.artists, new_names)
+        store.artists = np.insert(self.artists, at, interned(new_names))
+        remap = np.arange(len(self.artists)) + np.searchsorted(at, np.arange(len(self.artists)), side='right')
+        store.artist_codes = np.concatenate([
+            remap[self.artist_codes], np.searchsorted(store.artists, artists)
+        ]).astype(code_dtype(len(store.artists)))
+
+        song_bytes, song_offsets = pack(df['song'])
+        store.song_bytes = np.concatenate([self.song_bytes, song_bytes])
+        store.song_offsets = np.concatenate([self.song_offsets, song_offsets[1:] + self.song_offsets[-1]])
+
+        # Known genres keep their codes, new ones are appended in order of first appearance
+        names, offsets = explode_genres(df['genre'])
+        codes = {genre: code for code, genre in enumerate(self.genres)}
+        for genre in names:
+            codes.setdefault(genre, len(codes))
+        store.genres = interned(codes)
+        store.genre_codes = np.concatenate([
+            self.genre_codes, np.array([codes[genre] for genre in names], dtype=np.int64)
+        ]).astype(code_dtype(len(store.genres)))
+        store.genre_offsets = np.concatenate([self.genre_offsets, offsets[1:] + self.genre_offsets[-1]])
+
+        store.data = {}
+        for column, values in self.data.items():
+            store.data[column] = np.concatenate([values, df[column].to_numpy(dtype=values.dtype)])
+
+        live = self.live.copy()
+        live[removed] = False
+        store.live = np.concatenate([live, np.ones(len(df), dtype=bool)])
+        return store, remap
+
+    def view(self, mask):
+        return SongView(self, np.flatnonzero(mask))
+
+    def nbytes(self):
+        # Arrays plus the artist and genre strings they reference
+        arrays = [self.index, self.artist_codes, self.artists, self.song_bytes, self.song_offsets,
+                  self.genre_codes, self.genre_offsets, self.genres, self.live, *self.data.values()]
+        strings = (*self.artists, *self.genres)
+        return sum(a.nbytes for a in arrays) + sum(sys.getsizeof(s) for s in strings)
+
+
+class SongView:
+    # Filtered rows of a store, kept as row positions; rows are only copied out by frame()
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, column):
+        return self.store[column][self.rows]
+
+    def frame(self, start=0, stop=None):
+        return self.store.frame(self.rows[start:stop])
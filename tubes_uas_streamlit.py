@@ -1,7 +1,14 @@
-import pandas as pd
 import altair as alt
 import streamlit as st
 
+import data_loader
+import exports
+import home_charts
+import instrumentation
+import progressive
+import result_pages
+from warmup import Warmup
+
 st.set_page_config(
     page_title="Dashboard Spotify Dataset Analysis",
     page_icon="📊",
@@ -11,19 +18,16 @@ st.set_page_config(
 
 alt.themes.enable("dark")
 
-# Load data
-df = pd.read_csv("songs_normalize.csv")
-
-# Drop duplicates, keeping the row with the maximum popularity
-df = df.loc[df.groupby(['artist', 'song'])['popularity'].idxmax()]
-
-# Optionally drop any remaining duplicates (if you want to ensure no duplicates exist after the operation)
-df = df.drop_duplicates()
-df = df[df['genre'] != 'set()']
-df['genre'] = df['genre'].str.split(r'[;,]\s*')
-
-df['duration'] = df['duration_ms'] / 60000  # Convert duration from milliseconds to minutes
+# Per-section timings of this rerun, only collected when instrumentation is switched on
+trace = instrumentation.RerunTrace(instrumentation.ENABLED or st.query_params.get("debug") == "1")
 
+# Load data: preprocessed once per file version and shared by every session, held as a compact
+# column store. The live dataset swaps in a new version when the CSV changes, applying appended
+# rows as a delta. The first session of the process starts the warm-up, which loads it and builds
+# the indexes and default home charts in the background.
+@st.cache_resource
+def load_warmup(path):
+    return Warmup(path)
 
 
 st.markdown("""
@@ -80,6 +84,26 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+warmup = load_warmup(data_loader.DATASET_PATH)
+if not warmup.ready.is_set():
+    # Lightweight placeholder while the warm-up runs, replaced as soon as it is done
+    st.markdown('<p class="main-title">Spotify Music Dataset Analysis Dashboard</p>', unsafe_allow_html=True)
+    st.info("Preparing the dashboard, this page updates by itself when the data is ready.")
+    warmup.ready.wait(1)
+    st.rerun()
+if warmup.error is not None:
+    # Start a new warm-up on the next rerun instead of keeping the failure cached
+    load_warmup.clear()
+    raise warmup.error
+
+with trace.section('load') as record:
+    dataset = warmup.live.get()
+    songs = dataset.store
+    genre_index = dataset.genre_index
+    # Filtering, search, artist and home queries, shared with the HTTP API (query_api.py)
+    engine = dataset.engine
+    record['rows_out'] = len(songs)
+
 if 'show_search_songs' not in st.session_state:
     st.session_state.show_search_songs = False
 
@@ -119,53 +143,122 @@ with st.sidebar:
     # Filter by year range using a slider
     year_filter = st.slider(
         "Select Year Range",
-        min_value=int(df['year'].min()),  # Dynamically set min year
-        max_value=int(df['year'].max()),  # Dynamically set max year
-        value=(int(df['year'].min()), int(df['year'].max()))  # Default to full range
+        min_value=dataset.year_range[0],  # Dynamically set min year
+        max_value=dataset.year_range[1],  # Dynamically set max year
+        value=dataset.year_range  # Default to full range
     )
 
     # Filter by genre using multiselect
     select_all = st.checkbox("Select All Genres", value=True)
     if select_all:
-        genre_filter = df['genre'].explode().unique()  # Select all genres from the list
+        genre_filter = genre_index.genres  # Select all genres from the list
     else:
         genre_filter = st.multiselect(
             "Select Genre(s)",
-            options=df['genre'].explode().unique(),
+            options=genre_index.genres,
             default=[],
             help="Search and select one or multiple genres"
         )
 
-    # Apply filters to the DataFrame
-    filtered_df = df[
-        (df['year'] >= year_filter[0]) &  # Filter by start year
-        (df['year'] <= year_filter[1]) &  # Filter by end year
-        (df['genre'].apply(lambda x: any(g in genre_filter for g in x)))  # Filter by selected genres
-    ]
 
-# Filtered data
-df = filtered_df
+def apply_filters():
+    # Apply filters: a view of the matching rows, nothing is copied until a page needs them.
+    # Only the pages that list songs call this, the home page reads the cube
+    with trace.section('filter', rows_in=len(songs)) as record:
+        filtered = songs.view(engine.mask(year_filter, genre_filter))
+        record['rows_out'] = len(filtered)
+    return filtered
+
+
+def page_navigation(key, total, page_sizes, label):
+    # Previous / page info / page size / Next row over total rows, the page number kept in
+    # st.session_state[key]. Returns the [start, stop) slice of the current page
+    nav_prev, nav_info, nav_size, nav_next = st.columns([1, 2, 1, 1])
+    with nav_size:
+        page_size = st.selectbox(label, page_sizes, label_visibility="collapsed")
+    n_pages = result_pages.page_count(total, page_size)
+    page, start, stop = result_pages.page_bounds(total, st.session_state[key], page_size)
+    st.session_state[key] = page
+    # The page changes in the buttons' callbacks, so they are drawn enabled or disabled for the new page
+    with nav_prev:
+        st.button("Previous", disabled=page <= 1, on_click=result_pages.turn_page,
+                  args=(st.session_state, key, -1, n_pages))
+    with nav_next:
+        st.button("Next", disabled=page >= n_pages, on_click=result_pages.turn_page,
+                  args=(st.session_state, key, 1, n_pages))
+    with nav_info:
+        st.markdown(f"Page **{page}** of **{n_pages}** ({total} songs)")
+    return start, stop
+
+
+# Charts are cached per filter state, so reruns that do not change their inputs reuse the spec
+chart_cache = dataset.chart_cache
+filter_state = engine.filter_state(year_filter, genre_filter)
+
+# Heavy charts wait for their exact data only this long per rerun, see progressive.py
+budget = progressive.Budget()
+
+
+def show_chart(key, build, sample=None):
+    # sample builds the chart from sampled rows: drawn first when build misses the render budget
+    record = trace.start(f"chart:{key[1]}")
+    cache_key = key + filter_state
+    exact = True
+    if sample is None or cache_key in chart_cache:
+        spec = chart_cache.spec(cache_key, build)
+    else:
+        spec, exact = budget.result((engine.version,) + cache_key, lambda: chart_cache.spec(cache_key, build),
+                                    lambda: chart_cache.spec(('sample',) + cache_key, sample))
+        if not exact:
+            cache_key = ('sample',) + cache_key
+    # Streamlit moves the datasets out of the spec it is given, so hand it a shallow copy
+    st.vega_lite_chart(dict(spec), use_container_width=True)
+    trace.stop(record, rows_out=sum(len(rows) for rows in spec.get('datasets', {}).values()),
+               payload_bytes=chart_cache.weight_of(cache_key))
+    if not exact:
+        st.caption("Estimated from a sample of the songs, refining...")
+    if chart_cache.capped(spec):
+        st.caption("Only the first rows are drawn: the chart data is over the size limit")
+    # The rows behind the chart, only serialized when the button is clicked
+    st.download_button("Download data", lambda: exports.chart_csv(spec), file_name=f"{key[1]}.csv",
+                       mime='text/csv', key='export_' + '_'.join(map(str, key)))
+
+# Song detail toggles only live while their card is on screen
+if not st.session_state.show_search_songs:
+    result_pages.evict_stale_details(st.session_state)
 
-# Render content based on the show_search_songs state
 # Render content based on the show_search_songs state
 if st.session_state.show_search_songs:
+    trace.view = 'search_songs'
+    filtered = apply_filters()
     st.markdown('<p class="title">Search Songs</p>', unsafe_allow_html=True)
     search_term = st.text_input("Search", placeholder="Type a song...")
 
     if search_term:  # Ensure there's a search term entered
-        search_results = df[df['artist'].str.contains(search_term, case=False, na=False) |
-                            df['song'].str.contains(search_term, case=False, na=False) |
-                            df['genre'].apply(lambda genres: any(search_term.lower() in genre.lower() for genre in genres))]
-
-        # Convert 'genre' column from list to string for processing
-        search_results['genre_str'] = search_results['genre'].apply(lambda x: ', '.join(x) if isinstance(x, list) else x)
+        # Matching rows within the current filters, most popular first
+        with trace.section('search', rows_in=len(filtered)) as record:
+            search_hits = engine.search(search_term, year_filter, genre_filter)
+            record['rows_out'] = len(search_hits)
 
         # Display search results
         st.markdown(f"### Search Results for: **{search_term}**")
         
-        if not search_results.empty:
+        if len(search_hits):
             st.markdown("#### Songs in Search Results:")
 
+            # Start from the first page whenever the search term changes
+            if st.session_state.get('search_page_term') != search_term:
+                st.session_state.search_page_term = search_term
+                st.session_state.search_page = 1
+
+            start, stop = page_navigation('search_page', len(search_hits), result_pages.PAGE_SIZES, "Results per page")
+
+            # Only the rows of the current page are materialized and rendered
+            page_rows = search_hits[start:stop]
+            search_results = engine.rows(page_rows)
+            positions = dict(zip(search_results.index, page_rows))
+            result_pages.evict_stale_details(st.session_state, map(result_pages.detail_key, search_results.index))
+
             # Split search results into pairs
             pairs = [search_results.iloc[i:i+2] for i in range(0, len(search_results), 2)]
             
@@ -175,7 +268,7 @@ if st.session_state.show_search_songs:
 
                 for i, (idx, row) in enumerate(pair.iterrows()):  # Make sure to get both the index and the row
                     # Create a unique key for each song's detail visibility
-                    detail_key = f"show_detail_{idx}"  # Use idx for the detail key
+                    detail_key = result_pages.detail_key(idx)  # Use idx for the detail key
 
                     # Check if this key exists in session state, initialize if not
                     if detail_key not in st.session_state:
@@ -213,152 +306,176 @@ if st.session_state.show_search_songs:
                             </div>
                             """, unsafe_allow_html=True)
 
+                            # Nearest songs by audio features, within the current filters
+                            with trace.section('similar_songs', rows_in=len(filtered)) as record:
+                                neighbours, _ = engine.similar(positions[idx], year_filter, genre_filter)
+                                record['rows_out'] = len(neighbours)
+                            similar = engine.rows(neighbours)
+                            items = ''.join(
+                                f"<li>{song['song']} - {song['artist']} ({song['year']})</li>" for _, song in similar.iterrows()
+                            ) or "<li>No similar songs within the current filters.</li>"
+                            st.markdown(f"""
+                            <div style="background-color:#222222; border-radius:10px; padding:10px; margin:10px 0; text-align:left;">
+                                <h5 style="color:white; font-size:16px;">🎧 Similar Songs</h5>
+                                <ul style="color:white; font-size:14px; margin:0;">{items}</ul>
+                            </div>
+                            """, unsafe_allow_html=True)
+
         else:
+            result_pages.evict_stale_details(st.session_state)
             st.markdown("**No results found.**")
     else:
+        result_pages.evict_stale_details(st.session_state)
         st.markdown("**Please enter a search term.**")
 
 
 elif st.session_state.show_search_artists:
+    trace.view = 'search_artists'
+    filtered = apply_filters()
     st.markdown('<p class="title">Search Artists</p>', unsafe_allow_html=True)
     artist_search_term = st.text_input("Search Artists", placeholder="Type an artist's name...")
 
     if artist_search_term:
-        artist_results = filtered_df[
-            filtered_df['artist'].str.contains(artist_search_term, case=False, na=False)
-        ][['artist']].drop_duplicates()
+        with trace.section('artist_lookup', rows_in=len(filtered)) as record:
+            artist_results = engine.artists(artist_search_term, year_filter, genre_filter)
+            record['rows_out'] = len(artist_results)
 
-        if not artist_results.empty:
-            selected_artist = st.selectbox("Select an Artist", artist_results['artist'])
+        if artist_results:
+            selected_artist = st.selectbox("Select an Artist", artist_results)
 
             if selected_artist:
-                artist_songs = filtered_df[filtered_df['artist'] == selected_artist]
+                # A prolific artist's profile is drawn from a sample of their songs first when
+                # it is not ready within the render budget; its charts are cached apart then
+                with trace.section('artist_profile') as record:
+                    profile, exact = budget.result(
+                        (engine.version, 'artist_profile', selected_artist) + filter_state,
+                        lambda: engine.artist_profile(selected_artist, year_filter, genre_filter),
+                        lambda: engine.artist_profile(selected_artist, year_filter, genre_filter,
+                                                      sample=progressive.ARTIST_SAMPLE_ROWS))
+                    record['rows_out'] = profile.song_count
+                artist_page = 'artist' if exact else 'artist_sample'
 
                 st.markdown(f"Show Artists Data for : **{selected_artist}**")
+                if not exact:
+                    sampled = min(progressive.ARTIST_SAMPLE_ROWS, profile.song_count)
+                    st.caption(f"Estimated from a sample of {sampled:,} of {profile.song_count:,} songs, refining...")
 
                 # Render the same graphs as in the "Search Songs" functionality for this artist
 
                 col1, col2, col3 = st.columns([2, 2, 1.4])
                 with col1:
-                    avg_popularity_chart = alt.Chart(artist_songs).mark_line(point=True, color='#1DB954').encode(
-                        x=alt.X('year:O', title='Year'),
-                        y=alt.Y('mean(popularity):Q', title='Average Popularity'),
-                        tooltip=['year:O', 'mean(popularity):Q']
-                    ).properties(
-                        width=200,
-                        height=250
-                    )
+                    def avg_popularity_chart():
+                        return alt.Chart(profile.avg_popularity).mark_line(point=True, color='#1DB954').encode(
+                            x=alt.X('year:O', title='Year'),
+                            y=alt.Y('avg_popularity:Q', title='Average Popularity'),
+                            tooltip=['year:O', alt.Tooltip('avg_popularity:Q', title='Average Popularity')]
+                        ).properties(
+                            width=200,
+                            height=250
+                        )
                     st.markdown('<p class="subtitle">Average Popularity Across the Years</p>', unsafe_allow_html=True)
-                    st.altair_chart(avg_popularity_chart, use_container_width=True)
+                    show_chart((artist_page, 'avg_popularity_chart', selected_artist), avg_popularity_chart)
 
                     st.markdown('<p class="subtitle">Number of Released Songs per Year</p>', unsafe_allow_html=True)
-                    # Group data by year and count the number of songs
-                    songs_per_year = artist_songs.groupby('year')['song'].count().reset_index()
-                    songs_per_year.columns = ['year', 'num_songs']
-
-                    # Ensure the number of songs is an integer
-                    songs_per_year['num_songs'] = songs_per_year['num_songs'].astype(int)
-
-                    # Format 'num_songs' as string for tooltip display (to enforce integer appearance)
-                    songs_per_year['num_songs_str'] = songs_per_year['num_songs'].astype(str)
-
                     # Create a vertical bar chart for number of songs released per year
-                    songs_per_year_chart = alt.Chart(songs_per_year).mark_bar(color='#1DB954').encode(
-                        x=alt.X('year:O', title='Year'),
-                        y=alt.Y('num_songs:Q', title='Number of Songs'),
-                        tooltip=[
-                            alt.Tooltip('year:O', title='Year'),
-                            alt.Tooltip('num_songs_str:N', title='Number of Songs')  # Use string version to guarantee no decimals
-                        ]
-                    ).properties(
-                        width=200,
-                        height=250
-                    )
-
-                    st.altair_chart(songs_per_year_chart, use_container_width=True)
+                    def songs_per_year_chart():
+                        return alt.Chart(profile.songs_per_year).mark_bar(color='#1DB954').encode(
+                            x=alt.X('year:O', title='Year'),
+                            y=alt.Y('num_songs:Q', title='Number of Songs'),
+                            tooltip=[
+                                alt.Tooltip('year:O', title='Year'),
+                                alt.Tooltip('num_songs_str:N', title='Number of Songs')  # Use string version to guarantee no decimals
+                            ]
+                        ).properties(
+                            width=200,
+                            height=250
+                        )
+
+                    show_chart((artist_page, 'songs_per_year_chart', selected_artist), songs_per_year_chart)
 
 
                 # Graph for average duration of songs across the years
                 with col2:
-                    avg_duration_chart = alt.Chart(artist_songs).mark_line(point=True, color='#1DB954').encode(
-                        x=alt.X('year:O', title='Year'),
-                        y=alt.Y('mean(duration):Q', title='Average Duration (minute)'),
-                        tooltip=['year:O', 'mean(duration):Q']
-                    ).properties(
-                        width=200,
-                        height=250
-                    )
+                    def avg_duration_chart():
+                        return alt.Chart(profile.avg_duration).mark_line(point=True, color='#1DB954').encode(
+                            x=alt.X('year:O', title='Year'),
+                            y=alt.Y('avg_duration:Q', title='Average Duration (minute)'),
+                            tooltip=['year:O', alt.Tooltip('avg_duration:Q', title='Average Duration (minute)')]
+                        ).properties(
+                            width=200,
+                            height=250
+                        )
 
                     st.markdown('<p class="subtitle">Average Song Duration Across the Years</p>', unsafe_allow_html=True)
-                    st.altair_chart(avg_duration_chart, use_container_width=True)
+                    show_chart((artist_page, 'avg_duration_chart', selected_artist), avg_duration_chart)
 
                 # Add other graphs here as needed (danceability, number of songs per year, etc.)
                     st.markdown('<p class="subtitle">Most Popular Songs</p>', unsafe_allow_html=True)
-                    most_popular_songs = artist_songs.sort_values(by='popularity', ascending=False).head(5)
-
                     # Create a bar chart for the top 5 most popular songs
-                    popular_songs_chart = alt.Chart(most_popular_songs).mark_bar(color='#1DB954').encode(
-                        x=alt.X('popularity:Q', title='Popularity'),
-                        y=alt.Y('song:N', title='Song', sort='-x'),
-                        tooltip=['song:N', 'popularity:Q']
-                    ).properties(
-                        width=200,
-                        height=250
-                    )
-
-                    st.altair_chart(popular_songs_chart, use_container_width=True)
+                    def popular_songs_chart():
+                        return alt.Chart(profile.top_songs).mark_bar(color='#1DB954').encode(
+                            x=alt.X('popularity:Q', title='Popularity'),
+                            y=alt.Y('song:N', title='Song', sort='-x'),
+                            tooltip=['song:N', 'popularity:Q']
+                        ).properties(
+                            width=200,
+                            height=250
+                        )
+
+                    show_chart((artist_page, 'popular_songs_chart', selected_artist), popular_songs_chart)
 
             #     st.altair_chart(songs_per_year_chart, use_container_width=True)
                 # Donut chart for genres per song
                 with col3:
                     st.markdown('<p class="subtitle">Genres per Song</p>', unsafe_allow_html=True)
-                    # Explode genres for each song to handle multiple genres per song
-                    genres_per_song = artist_songs.explode('genre')
-                    genre_count = genres_per_song.groupby('genre')['song'].count().reset_index()
-                    genre_count.columns = ['genre', 'num_songs']
-
                     # Create a donut chart for genres per song
                     # Create a donut chart for genres per song
-                    donut_chart = alt.Chart(genre_count).mark_arc(innerRadius=50).encode(
-                        theta=alt.Theta('num_songs:Q', title='Number of Songs'),
-                        color=alt.Color(
-                            'genre:N',
-                            scale=alt.Scale(scheme='greens'),  # Use green color scheme
-                            legend=alt.Legend(title="Genre")
-                        ),
-                        tooltip=[
-                            alt.Tooltip('genre:N', title='Genre'),
-                            alt.Tooltip('num_songs:Q', title='Number of Songs', format='.0f')  # Ensure integer display
-                        ]
-                    ).properties(
-                        width=150,
-                        height=250
-                    )
-                    st.altair_chart(donut_chart, use_container_width=True)
+                    def donut_chart():
+                        return alt.Chart(profile.genre_count).mark_arc(innerRadius=50).encode(
+                            theta=alt.Theta('num_songs:Q', title='Number of Songs'),
+                            color=alt.Color(
+                                'genre:N',
+                                scale=alt.Scale(scheme='greens'),  # Use green color scheme
+                                legend=alt.Legend(title="Genre")
+                            ),
+                            tooltip=[
+                                alt.Tooltip('genre:N', title='Genre'),
+                                alt.Tooltip('num_songs:Q', title='Number of Songs', format='.0f')  # Ensure integer display
+                            ]
+                        ).properties(
+                            width=150,
+                            height=250
+                        )
+                    show_chart((artist_page, 'donut_chart', selected_artist), donut_chart)
 
                     # Loudness Distribution
                     st.markdown('<p class="subtitle">Loudness Distribution</p>', unsafe_allow_html=True)
 
-                    loudness_distribution_chart = alt.Chart(artist_songs).mark_point(size=60, color='#1DB954').encode(
-                        x=alt.X('song:N', title='Song', sort='-y'),  # Sort songs for better visibility
-                        y=alt.Y('loudness:Q', title='Loudness (dB)'),
-                        tooltip=[
-                            alt.Tooltip('song:N', title='Song'),
-                            alt.Tooltip('artist:N', title='Artist'),
-                            alt.Tooltip('loudness:Q', title='Loudness (dB)', format='.2f')
-                        ]
-                    ).properties(
-                        width=150,
-                        height=250
-                    )
-
-                    st.altair_chart(loudness_distribution_chart, use_container_width=True)
+                    def loudness_distribution_chart():
+                        return alt.Chart(profile.loudness).mark_point(size=60, color='#1DB954').encode(
+                            x=alt.X('song:N', title='Song', sort='-y'),  # Sort songs for better visibility
+                            y=alt.Y('loudness:Q', title='Loudness (dB)'),
+                            tooltip=[
+                                alt.Tooltip('song:N', title='Song'),
+                                alt.Tooltip('artist:N', title='Artist'),
+                                alt.Tooltip('loudness:Q', title='Loudness (dB)', format='.2f')
+                            ]
+                        ).properties(
+                            width=150,
+                            height=250
+                        )
+
+                    show_chart((artist_page, 'loudness_distribution_chart', selected_artist), loudness_distribution_chart)
+                    if profile.loudness_truncated:
+                        st.caption(f"Showing {len(profile.loudness)} of {profile.song_count} songs.")
         else:
             st.markdown("**No artists found.**")
     else:
         st.markdown("**Please enter an artist's name.**")
 
 elif st.session_state.show_about:
+    trace.view = 'about'
+    filtered = apply_filters()
     st.markdown('<p style="font-size: 32px; font-family: sans-serif; color: white; font-weight: bold;">About</p>', unsafe_allow_html=True)
     st.markdown("""
     <p class="subtitle">
@@ -388,9 +505,45 @@ elif st.session_state.show_about:
         <a href="https://www.kaggle.com/datasets/paradisejoy/top-hits-spotify-from-20002019" target="_blank">Top Hits Spotify from 2000-2019</a>.
     </p>
     """, unsafe_allow_html=True)
-    st.dataframe(df)
+
+    # Start from the first page whenever the filters change
+    if st.session_state.get('about_page_filter') != filter_state:
+        st.session_state.about_page_filter = filter_state
+        st.session_state.about_page = 1
+
+    start, stop = page_navigation('about_page', len(filtered), result_pages.TABLE_PAGE_SIZES, "Rows per page")
+
+    # Only the rows of the current page are materialized and sent to the browser
+    with trace.section('about_table', rows_in=len(filtered)) as record:
+        df = filtered.frame(start, stop)
+        st.dataframe(df)
+        record['rows_out'] = len(df)
+        if trace.enabled:
+            record['payload_bytes'] = int(df.memory_usage(deep=True).sum())
+
+    # Download of the whole filtered table, written in chunks to a temporary file on click. Streamlit
+    # holds a download in memory, so big tables are streamed by the API's /export endpoint instead
+    export_format, export_button = st.columns([1, 4])
+    with export_format:
+        extension, mime = exports.FORMATS[st.selectbox("Export format", list(exports.FORMATS), label_visibility="collapsed")]
+    with export_button:
+        if len(filtered) <= exports.APP_EXPORT_MAX_ROWS:
+            st.download_button(
+                f"Download {len(filtered)} songs",
+                lambda: exports.export_bytes(filtered, extension),
+                file_name=f"songs_{year_filter[0]}-{year_filter[1]}.{extension}",
+                mime=mime,
+            )
+        elif exports.EXPORT_URL:
+            st.link_button(f"Download {len(filtered)} songs",
+                           exports.export_url(exports.EXPORT_URL, extension, year_filter, None if select_all else genre_filter))
+        else:
+            st.button(f"Download {len(filtered)} songs", disabled=True)
+            st.caption(f"Downloads in the app are limited to {exports.APP_EXPORT_MAX_ROWS:,} songs. "
+                       "Narrow the filters, or export through the /export endpoint of query_api.py.")
     
 else:
+    trace.view = 'home'
     st.markdown("""
     <p style="font-size: 32px; font-family: 'Poppins', sans-serif; color: white; font-weight: bold;">
     Spotify Music Dataset Analysis Dashboard
@@ -404,46 +557,26 @@ else:
     """, unsafe_allow_html=True)
 
 
-    def make_donut(explicit_count, non_explicit_count, input_color):
-        if input_color == 'green':
-            chart_color = ['#E74C3C', '#1DB954']
-
-        total = explicit_count + non_explicit_count
-        explicit_percentage = explicit_count / total * 100
-        non_explicit_percentage = non_explicit_count / total * 100
-
-        source = pd.DataFrame({
-            "Status": ["Explicit", "Non-Explicit"],
-            "Value": [explicit_count, non_explicit_count],
-            "Percentage": [explicit_percentage, non_explicit_percentage]
-        })
-
-        plot = alt.Chart(source).mark_arc(innerRadius=70, outerRadius=85, cornerRadius=10).encode(
-            theta=alt.Theta(field="Value", type="quantitative"),
-            color=alt.Color("Status:N",
-                            scale=alt.Scale(
-                                domain=["Explicit", "Non-Explicit"],
-                                range=chart_color),
-                            legend=None),
-            tooltip=[alt.Tooltip("Status:N"), alt.Tooltip("Value:Q"), alt.Tooltip("Percentage:Q", format=".1f")]
-        ).properties(width=220, height=220)
-
-        text = alt.Chart(pd.DataFrame({'text': [f'{non_explicit_percentage:.1f}%']})).mark_text(
-            align='center', fontSize=30, fontWeight=600, color='#1DB954'
-        ).encode(
-            text='text:N'
-        ).properties(width=220, height=220)
-
-        return plot + text
+    col1, col2, col3 = st.columns((1, 3, 2), gap='large')
 
+    # Every home chart rolls up from the pre-aggregated cube instead of scanning the filtered rows
+    with trace.section('rollup') as record:
+        home = engine.home(year_filter, genre_filter)
+        record['rows_out'] = home.total_songs
 
-    col1, col2, col3 = st.columns((1, 3, 2), gap='large')
+    # Stand-in rollup for the charts that miss the render budget, built at most once per rerun
+    home_samples = []
 
-    df = filtered_df
+    def home_sample():
+        if not home_samples:
+            home_samples.append(engine.home_sample(year_filter, genre_filter, sample=progressive.SAMPLE_ROWS))
+        return home_samples[0]
 
-    total_songs = df.shape[0]
-    total_artists = df['artist'].nunique()
-    total_genres = df['genre'].explode().nunique()
+    total_songs = home.total_songs
+    total_artists = home.total_artists
+    total_genres = home.total_genres
+    if total_songs == 0:
+        st.info("No songs match the filters")
         
     with col1:
         st.markdown(f'<p class="subtitle">Total Songs<br><span class="number">{total_songs}</span></p>', unsafe_allow_html=True)
@@ -451,124 +584,52 @@ else:
         st.markdown(f'<p class="subtitle">Total Genres<br><span class="number">{total_genres}</span></p>', unsafe_allow_html=True)
 
     with col2:
-        genre_count = df.explode('genre').groupby('genre').size().reset_index(name='song_count')
-        top_10_genres = genre_count.sort_values(by='song_count', ascending=False).head(8)
-
         # Create the Altair bar chart
         st.markdown('<p class="subtitle"> Number of Songs per Genre </p>', unsafe_allow_html=True)
-        genre_chart = alt.Chart(top_10_genres).mark_bar(color='#1DB954').encode(
-            x=alt.X('genre:N', title='Genre', sort='-y'),
-            y=alt.Y('song_count:Q', title='Number of Songs'),
-            tooltip=['genre:N', 'song_count:Q']
-        ).properties(
-            width=500,
-            height=280
-        ).configure_title(
-            fontSize=20,
-            anchor='start',
-            font='Arial'
-        ).configure_axis(
-            labelFontSize=12,
-            titleFontSize=14
-    )
-        st.altair_chart(genre_chart, use_container_width=True)
+        show_chart(('home', 'genre_chart'), lambda: home_charts.genre_chart(home))
         
     with col3:
         st.markdown('<p class="subtitle"> Non-Explicit Songs Percentage </p>', unsafe_allow_html=True)
-        explicit_count = df[df['explicit'] == True].shape[0]  # Count where explicit is True
-        non_explicit_count = df[df['explicit'] == False].shape[0]  # Count where explicit is False
-        # Create the chart with green color scheme
-        donut_chart = make_donut(explicit_count, non_explicit_count, 'green')
-        donut_chart  
+        show_chart(('home', 'donut_chart'), lambda: home_charts.donut_chart(home))
 
     col1, col2= st.columns((5, 5), gap='large')
 
     with col1:
         st.markdown('<p class="subtitle">Top Artists by Number of Songs</p>', unsafe_allow_html=True)
-        # Total songs per artist
-        artist_song_count = df.groupby('artist').size().reset_index(name='song_count')
-        top_artists_by_songs = artist_song_count.sort_values(by='song_count', ascending=False).head(5)  # Top 5 artists
-
-        artist_chart = alt.Chart(top_artists_by_songs).mark_bar(color='#1DB954').encode(
-            x=alt.X('song_count:Q', title='Number of Songs'),
-            y=alt.Y('artist:N', sort='-x', title='Artist'),
-            tooltip=['artist:N', 'song_count:Q']
-        ).properties(
-            width=400,
-            height=280
-        )
-
-        st.altair_chart(artist_chart, use_container_width=True)
+        show_chart(('home', 'artist_chart'), lambda: home_charts.artist_chart(home),
+                   lambda: home_charts.artist_chart(home_sample()))
 
     with col2:
         st.markdown('<p class="subtitle">Total Songs Released Per Year</p>', unsafe_allow_html=True)
-        # Group data by year to calculate the number of songs and average popularity
-        annual_trends = df.groupby('year').agg(
-            total_songs=('song', 'count'),
-            avg_popularity=('popularity', 'mean')
-        ).reset_index()
-
-        # Line chart for the total number of songs released per year
-        songs_trend_chart = alt.Chart(annual_trends).mark_line(color='#1DB954', point=True).encode(
-            x=alt.X('year:O', title='Year'),
-            y=alt.Y('total_songs:Q', title='Total Songs Released'),
-            tooltip=['year:O', 'total_songs:Q']
-        ).properties(
-            width=400,
-            height=280
-        )
-        st.altair_chart(songs_trend_chart, use_container_width=True)
+        show_chart(('home', 'songs_trend_chart'), lambda: home_charts.songs_trend_chart(home))
 
     col1, col2 = st.columns((5, 5), gap='large')
     # Danceability Distribution Based on Songs
     with col1:
         st.markdown('<p class="subtitle">Top Genres by Popularity</p>', unsafe_allow_html=True)
-
-        # Calculate the total popularity for each genre
-        genre_popularity = (
-            df.explode('genre')  # Handle multiple genres per song
-            .groupby('genre')['popularity']
-            .sum()
-            .reset_index()
-            .rename(columns={'popularity': 'total_popularity'})
-        )
-
-        # Sort genres by popularity and select the top 10
-        top_genres = genre_popularity.sort_values(by='total_popularity', ascending=False).head(10)
-
-        # Create a vertical bar chart for top genres by popularity
-        top_genres_vertical_chart = alt.Chart(top_genres).mark_line(point=True, color='#1DB954').encode(
-            x=alt.X('genre:N', title='Genre', sort='-y'),
-            y=alt.Y('total_popularity:Q', title='Total Popularity'),
-            tooltip=[
-                alt.Tooltip('genre:N', title='Genre'),
-                alt.Tooltip('total_popularity:Q', title='Total Popularity', format='.2f')
-            ]
-        ).properties(
-            width=500,
-            height=380
-        )
-
-        st.altair_chart(top_genres_vertical_chart, use_container_width=True)
+        show_chart(('home', 'top_genres_vertical_chart'), lambda: home_charts.top_genres_vertical_chart(home))
 
     with col2:
         st.markdown('<p class="subtitle">Danceability Distribution by Genre</p>', unsafe_allow_html=True)
-
-        # Prepare data: Flatten the genres for individual songs
-        danceability_data = df.explode('genre')[['genre', 'danceability']]
-
-        # Create a boxplot
-        danceability_boxplot = alt.Chart(danceability_data).mark_boxplot(extent='min-max', color='#1DB954').encode(
-            x=alt.X('danceability:Q', title='Danceability'),
-            y=alt.Y('genre:N', title='Genre', sort='-x'),
-            color=alt.Color('genre:N', legend=None),  # Use the default color for genres
-            tooltip=[
-                alt.Tooltip('genre:N', title='Genre'),
-                alt.Tooltip('danceability:Q', title='Danceability')
-            ]
-        ).properties(
-            width=500,
-            height=380
-        )
-
-        st.altair_chart(danceability_boxplot, use_container_width=True)
+        show_chart(('home', 'danceability_boxplot'), lambda: home_charts.danceability_boxplot(home),
+                   lambda: home_charts.danceability_boxplot(home_sample()))
+
+# Charts drawn from a sample are replaced by the exact ones with a full rerun as soon as their
+# data is ready; until then a fragment polls for it without blocking the page
+if budget.pending:
+    @st.fragment(run_every=progressive.POLL_SECONDS)
+    def refine_charts():
+        if budget.refined():
+            st.rerun()
+
+    refine_charts()
+
+# Publish this rerun's timings and show them in the sidebar
+if trace.enabled:
+    rerun_seconds = trace.finish()
+    with st.sidebar.expander("Performance"):
+        st.markdown(f"Rerun: **{rerun_seconds * 1000:.1f} ms** ({trace.view})")
+        st.markdown(f"Song store: **{songs.nbytes() / 2**20:.1f} MB** for {len(songs)} rows")
+        st.dataframe(trace.frame(), hide_index=True)
+        st.caption("Process totals (Prometheus text format)")
+        st.code(instrumentation.registry.prometheus_text(), language=None)
@@ -0,0 +1,79 @@
+# Startup warm-up: loads the dataset and precomputes the default home page in the background
+#
+# The first session of a process starts it and gets a placeholder until it is ready, instead of
+# paying for the CSV load, the indexes and the home charts on its request path. Afterwards the
+# default view (full year range, all genres) is served from the chart cache like any later rerun.
+# SPOTIFY_WARMUP=0 loads the dataset on the first request instead, with indexes built on first use.
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import home_charts
+from live_dataset import LiveDataset
+
+WARMUP = os.environ.get("SPOTIFY_WARMUP", "1") not in ("", "0")
+
+# Threads building indexes and chart specs side by side
+WARMUP_WORKERS = int(os.environ.get("SPOTIFY_WARMUP_WORKERS", "4"))
+
+# Indexes built during the warm-up; the cube builds the genre index it depends on
+MEMBERS = ('cube', 'artist_index', 'search_index', 'similar_songs')
+
+logger = logging.getLogger("dashboard.warmup")
+
+
+def default_filter_state(dataset):
+    # Filter state of a fresh session, as the script builds it for chart cache keys
+    return (dataset.year_range, dataset.genre_index.selection_key(dataset.genre_index.genres))
+
+
+def warm(dataset, workers=WARMUP_WORKERS):
+    # Build the indexes of dataset and the home chart specs of its default view
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmup') as pool:
+        for future in [pool.submit(dataset.member, name) for name in MEMBERS]:
+            future.result()
+
+        home = dataset.cube.rollup(dataset.year_range, dataset.genre_index.genres)
+        filter_state = default_filter_state(dataset)
+        futures = {
+            name: pool.submit(dataset.chart_cache.spec, ('home', name) + filter_state, lambda build=build: build(home))
+            for name, build in home_charts.HOME_CHARTS.items()
+        }
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception:
+                # The page raises the same error when it draws the chart, the warm-up goes on
+                logger.exception("warm-up of chart %s failed", name)
+
+
+class Warmup:
+    # Live dataset of one CSV, loaded and warmed in a background thread; ready is set when done
+
+    def __init__(self, path, background=WARMUP):
+        self.path = path
+        self.live = None
+        self.error = None
+        self.seconds = None
+        self.ready = threading.Event()
+        if background:
+            threading.Thread(target=self.run, name="dataset-warmup", daemon=True).start()
+        else:
+            self.live = LiveDataset(path)
+            self.ready.set()
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.live = LiveDataset(self.path)
+            warm(self.live.current)
+        except Exception as error:
+            if self.live is None:
+                # Nothing to serve; the script re-raises this and starts a new warm-up next time
+                self.error = error
+            logger.exception("warm-up of %s failed", self.path)
+        self.seconds = time.perf_counter() - started
+        logger.info("warm-up of %s done in %.3f s", self.path, self.seconds)
+        self.ready.set()